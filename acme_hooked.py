@@ -6,19 +6,81 @@
 # Licensed under the MIT license.
 # source: https://github.com/sosnik/acmectl/blob/master/acme_hooked.py
 
-import argparse, subprocess, json, sys, base64, binascii, time, hashlib, re, textwrap, logging, importlib.util, os
-from urllib.request import urlopen, Request
+import argparse, contextlib, subprocess, json, sys, base64, binascii, time, hashlib, hmac, re, textwrap, logging, importlib.util, os, threading, http.client, ctypes, ctypes.util, heapq, itertools, random, email.utils, socket, struct, datetime
+from urllib.parse import urlsplit, urljoin, quote, unquote
+from urllib.request import getproxies, proxy_bypass
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-__all__ = ['sign_crts', 'list_profiles', 'get_cert_id'] ## don't forget: revocation, keychange, ari (placeholders below)
+__all__ = ['sign_crts', 'list_profiles', 'get_cert_id', 'cert_info', 'renewal_info', 'rate_budget', 'deploy_crts', 'trace_stats'] ## don't forget: revocation, keychange (placeholders below)
 
 LOGGER = logging.getLogger(__name__)
 DEFAULT_DIRECTORY_URL = "https://acme-v02.api.letsencrypt.org/directory"
+DEFAULT_CONCURRENCY = 8 # max. authorizations handled at the same time
+
+# === Tracing ===
+# Where a run spends its time. A span times one piece of work: a request, a JWS signature, a subprocess, a hook
+# call, a poll, the DNS propagation wait, and the phases of sign_crts around them. A counter counts events such as
+# bad nonces, retries and poll iterations. Totals are kept per process (see trace_stats); with a trace file, every
+# span and event is also appended to it as a JSON line, e.g. {"span": "request", "seconds": 0.12, "url": ...,
+# "status": 200, "run": ..., "pid": ..., "thread": ..., "time": ...} or {"event": "bad_nonce", "url": ...}.
+TRACE_MAX = 16 * 1024 * 1024 # bytes; a bigger trace file is moved to <file>.1 (checked as it is written)
+_TRACE, _TRACE_LOCK = {"file": None, "size": 0, "spans": {}, "counters": {}}, threading.Lock()
+
+def _trace_open(trace_file):
+    with _TRACE_LOCK:
+        if _TRACE["file"] != trace_file:
+            _TRACE["file"], _TRACE["size"] = trace_file, os.path.getsize(trace_file) if os.path.isfile(trace_file) else 0
+
+def _trace_write(**record):
+    if _TRACE["file"]:
+        line = json.dumps(dict(record, run=_RUN, pid=os.getpid(), thread=threading.current_thread().name, time=round(time.time(), 3))) + "\n"
+        with _TRACE_LOCK:
+            # rotate by the bytes this process wrote; the real size is checked before rotating, since another
+            # process (e.g. getone next to the daemon) may have rotated the file already
+            if _TRACE["size"] + len(line) > TRACE_MAX:
+                _TRACE["size"] = os.path.getsize(_TRACE["file"]) if os.path.isfile(_TRACE["file"]) else 0
+                if _TRACE["size"] + len(line) > TRACE_MAX:
+                    os.replace(_TRACE["file"], _TRACE["file"] + ".1")
+                    _TRACE["size"] = 0
+            with open(_TRACE["file"], "a") as file:
+                file.write(line)
+            _TRACE["size"] += len(line)
+
+def _count(event, **details):
+    with _TRACE_LOCK:
+        _TRACE["counters"][event] = _TRACE["counters"].get(event, 0) + 1
+    _trace_write(event=event, **details)
+
+def _record_span(name, seconds, **details):
+    with _TRACE_LOCK:
+        total = _TRACE["spans"].setdefault(name, [0, 0.0])
+        total[0] += 1
+        total[1] += seconds
+    _trace_write(span=name, seconds=round(seconds, 6), **details)
+
+# times the block as span `name`; the block may add details to the dict it gets, and an exception is recorded too
+@contextlib.contextmanager
+def _span(name, **details):
+    start = time.time()
+    try:
+        yield details
+    except Exception as error:
+        details["error"] = str(error).split("\n")[0] or type(error).__name__
+        raise
+    finally:
+        _record_span(name, time.time() - start, **details)
+
+def trace_stats():
+    """Return {"spans": {name: [count, seconds]}, "counters": {event: count}} for this process so far."""
+    with _TRACE_LOCK:
+        return {"spans": {name: list(total) for name, total in _TRACE["spans"].items()}, "counters": dict(_TRACE["counters"])}
 
 # === Helper functions ===
 # helper function - run external commands
 def _cmd(cmd_list, stdin=None, cmd_input=None, err_msg="Command Line Error"):
-    proc = subprocess.Popen(cmd_list, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out, err = proc.communicate(cmd_input)
+    with _span("subprocess", command=os.path.basename(cmd_list[0])):
+        proc = subprocess.Popen(cmd_list, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate(cmd_input)
     if proc.returncode != 0:
         raise IOError("{0}\n{1}".format(err_msg, err))
     return out
@@ -32,60 +94,770 @@ def _do_hook(hook_list, cmd, argument_list, stdin=None, cmd_input=None, echo=Fal
     elif out:
         LOGGER.info(out.decode('utf8').rstrip("\n"))
 
+# === Hooks ===
+# "single" is the classic protocol: one process per call, `hook <cmd> <args...>`.
+# "batch" and "serve" are opt-in protocols for hooks that implement the `batch`/`serve` verbs. Requests are
+# JSON lines on the hook's stdin, {"id": 0, "cmd": "setup", "domain": ..., "token": ..., "content": ...},
+# each answered by one JSON line on stdout, {"id": 0, "status": "ok"|"error", "detail": ...}.
+# `hook batch` gets all setup/check/remove requests of a stage at once and exits at EOF;
+# `hook serve` is started once per run and answers requests one at a time over the pipe.
+# `write` always uses the classic protocol since it passes the certificate on stdin.
+class _Hook:
+    batched = False
+
+    def __init__(self, hook_list):
+        self.hook_list = hook_list
+
+    def call(self, cmd, argument_list, stdin=None, cmd_input=None, echo=False):
+        _do_hook(self.hook_list, cmd, argument_list, stdin=stdin, cmd_input=cmd_input, echo=echo)
+
+    # run one command for many (domain, token, content) tuples; returns an IOError or None for each
+    def call_many(self, cmd, argument_lists):
+        errors = []
+        for argument_list in argument_lists:
+            try:
+                self.call(cmd, argument_list)
+                errors.append(None)
+            except IOError as error:
+                errors.append(error)
+        return errors
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _request(request_id, cmd, argument_list):
+        request = {"id": request_id, "cmd": cmd}
+        request.update(zip(["domain", "token", "content"], argument_list))
+        return json.dumps(request)
+
+    @staticmethod
+    def _answer(line):
+        answer = json.loads(line)
+        if answer.get("detail"):
+            (LOGGER.info if answer.get("status") == "ok" else LOGGER.error)(answer["detail"].rstrip("\n"))
+        return answer
+
+class _BatchHook(_Hook):
+    batched = True
+
+    def call_many(self, cmd, argument_lists):
+        if not argument_lists:
+            return []
+        requests = "".join(self._request(i, cmd, args) + "\n" for i, args in enumerate(argument_lists))
+        proc = subprocess.Popen(self.hook_list + ["batch"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate(requests.encode('utf8'))
+        answers = {}
+        for line in out.decode('utf8').splitlines():
+            if line.startswith("{"):
+                answer = self._answer(line)
+                answers[answer.get("id")] = answer
+            elif line:
+                LOGGER.info(line)
+        errors = []
+        for i, args in enumerate(argument_lists):
+            status = answers.get(i, {}).get("status")
+            errors.append(None if status == "ok" else IOError("Hook Script Error\n{0} {1}: {2}".format(cmd, args[0], answers.get(i, {}).get("detail") or err)))
+        return errors
+
+class _CoprocessHook(_Hook):
+    def __init__(self, hook_list):
+        super().__init__(hook_list)
+        self.proc, self.lock, self.ids = None, threading.Lock(), itertools.count()
+
+    def call(self, cmd, argument_list, stdin=None, cmd_input=None, echo=False):
+        if cmd_input is not None:
+            return super().call(cmd, argument_list, stdin=stdin, cmd_input=cmd_input, echo=echo)
+        with self.lock: # one request in flight at a time
+            if self.proc is None:
+                self.proc = subprocess.Popen(self.hook_list + ["serve"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+            request_id = next(self.ids)
+            self.proc.stdin.write(self._request(request_id, cmd, argument_list) + "\n")
+            self.proc.stdin.flush()
+            while True:
+                line = self.proc.stdout.readline()
+                if not line:
+                    raise IOError("Hook Script Error\nhook process exited while handling {0}".format(cmd))
+                if not line.startswith("{"):
+                    LOGGER.info(line.rstrip("\n"))
+                    continue
+                answer = self._answer(line)
+                if answer.get("id") == request_id:
+                    break
+        if answer.get("status") != "ok":
+            raise IOError("Hook Script Error\n{0}: {1}".format(cmd, answer.get("detail")))
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc = None
+
+# A .py hook is a plugin instead: imported once per process and called in-process (whatever the hook mode), so it
+# can keep state such as open connections from one call to the next. It defines setup/check/remove(domain, token,
+# content), activate(), finish() and write(csrfile, certificate), of which only setup, remove and write are
+# required. setup/check/remove can also come as e.g. setup_many([(domain, token, content), ...]), returning one
+# error (or None) per tuple; a plugin with setup_many or remove_many is batched. Functions may be called from
+# several threads at once. Exceptions become hook errors; a returned string is logged (write's is echoed).
+# An optional deploy(*csrfiles) is called once after a run's certificates are written (see deploy_crts).
+_PLUGINS, _PLUGINS_LOCK = {}, threading.Lock()
+
+class _PluginHook(_Hook):
+    def __init__(self, hook_list):
+        super().__init__(hook_list)
+        path = os.path.abspath(hook_list[0])
+        with _PLUGINS_LOCK:
+            if path not in _PLUGINS:
+                spec = importlib.util.spec_from_file_location("acme_hook_" + hashlib.sha256(path.encode('utf8')).hexdigest()[:16], path)
+                module = importlib.util.module_from_spec(spec)
+                try:
+                    spec.loader.exec_module(module)
+                except Exception as error:
+                    raise IOError("Hook Script Error\nCannot load {0}: {1}".format(path, error))
+                _PLUGINS[path] = module
+        self.module = _PLUGINS[path]
+        self.batched = hasattr(self.module, "setup_many") or hasattr(self.module, "remove_many")
+
+    def call(self, cmd, argument_list, stdin=None, cmd_input=None, echo=False):
+        function = getattr(self.module, cmd, None)
+        if function is None:
+            if cmd in ["activate", "check", "finish", "deploy"]:
+                return
+            raise IOError("Hook Script Error\n{0} has no {1}()".format(self.hook_list[0], cmd))
+        try:
+            out = function(*argument_list, cmd_input.decode('utf8')) if cmd == "write" else function(*argument_list)
+        except Exception as error:
+            raise IOError("Hook Script Error\n{0} {1}: {2}".format(cmd, " ".join(argument_list[:1]), error))
+        if echo and out:
+            sys.stdout.write(out)
+        elif out:
+            LOGGER.info(out.rstrip("\n"))
+
+    def call_many(self, cmd, argument_lists):
+        function = getattr(self.module, cmd + "_many", None)
+        if function is None or not argument_lists:
+            return super().call_many(cmd, argument_lists)
+        try:
+            errors = function([tuple(args) for args in argument_lists]) or [None] * len(argument_lists)
+        except Exception as error:
+            errors = [error] * len(argument_lists)
+        return [None if error is None else IOError("Hook Script Error\n{0} {1}: {2}".format(cmd, args[0], error)) for args, error in zip(argument_lists, errors)]
+
+_HOOK_MODES = {"single": _Hook, "batch": _BatchHook, "serve": _CoprocessHook}
+
+# every hook call is a "hook" span, whatever the protocol
+class _TracedHook:
+    def __init__(self, hook):
+        self.hook, self.batched = hook, hook.batched
+
+    def call(self, cmd, argument_list, stdin=None, cmd_input=None, echo=False):
+        with _span("hook", cmd=cmd, domain=argument_list[0] if argument_list and cmd != "write" else None):
+            return self.hook.call(cmd, argument_list, stdin=stdin, cmd_input=cmd_input, echo=echo)
+
+    def call_many(self, cmd, argument_lists):
+        with _span("hook", cmd=cmd, calls=len(argument_lists)) as span:
+            errors = self.hook.call_many(cmd, argument_lists)
+            span["errors"] = sum(error is not None for error in errors)
+            return errors
+
+    def close(self):
+        self.hook.close()
+
+def _make_hook(hook_list, hook_mode="single"):
+    if hook_list and hook_list[0].endswith(".py"):
+        return _TracedHook(_PluginHook(hook_list))
+    return _TracedHook(_HOOK_MODES[hook_mode](hook_list))
+
+# keep-alive connection pool - one idle stack per (scheme, host, port), shared by every request in the process.
+# A run makes dozens of requests to the same CA; reusing connections saves a TCP+TLS handshake on each of them.
+# Like urlopen, it honours the http_proxy/https_proxy/no_proxy environment variables: HTTPS goes through a CONNECT
+# tunnel, plain HTTP is sent to the proxy with the full url.
+class _ConnectionPool:
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.stats = {"requests": 0, "handshakes": 0, "reused": 0, "reconnects": 0, "seconds": 0.0}
+
+    def _count(self, **counters):
+        with self.lock:
+            for name, value in counters.items():
+                self.stats[name] += value
+
+    @staticmethod
+    def _proxy(scheme, host):
+        proxy = getproxies().get(scheme)
+        return urlsplit(proxy if "://" in proxy else "http://" + proxy) if proxy and not proxy_bypass(host) else None
+
+    def _acquire(self, key, proxy):
+        with self.lock:
+            if self.idle.get(key):
+                return self.idle[key].pop(), True
+        scheme, host, port = key
+        conn_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        self._count(handshakes=1)
+        if proxy is None:
+            return conn_class(host, port, timeout=self.timeout), False
+        auth = {"Proxy-Authorization": "Basic " + base64.b64encode("{0}:{1}".format(unquote(proxy.username), unquote(proxy.password or "")).encode()).decode()} if proxy.username else {}
+        if scheme != "https":
+            conn = http.client.HTTPConnection(proxy.hostname, proxy.port or 80, timeout=self.timeout)
+            conn.proxy_headers = auth
+            return conn, False
+        conn = conn_class(proxy.hostname, proxy.port or 80, timeout=self.timeout)
+        conn.set_tunnel(host, port, headers=auth)
+        return conn, False
+
+    def _release(self, key, conn):
+        with self.lock:
+            self.idle.setdefault(key, []).append(conn)
+
+    def request(self, method, url, body=None, headers=None):
+        parts = urlsplit(url)
+        key, proxy = (parts.scheme, parts.hostname, parts.port), self._proxy(parts.scheme, parts.hostname)
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        if proxy is not None and parts.scheme != "https":
+            path = "{0}://{1}{2}".format(parts.scheme, parts.netloc, path) # plain http goes to the proxy as an absolute url
+        start_time = time.time()
+        while True:
+            conn, reused = self._acquire(key, proxy)
+            try:
+                conn.request(method, path, body=body, headers=dict(headers or {}, **getattr(conn, "proxy_headers", {})))
+                resp = conn.getresponse()
+                resp_data = resp.read()
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                if not reused:
+                    raise
+                self._count(reconnects=1) # server closed an idle keep-alive connection, retry on a fresh one
+                continue
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(key, conn)
+            self._count(requests=1, reused=int(reused), seconds=time.time() - start_time)
+            return resp.status, resp.msg, resp_data
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def summary(self, since=None):
+        since = since or {}
+        with self.lock:
+            delta = {name: value - since.get(name, 0) for name, value in self.stats.items()}
+        return "{requests} requests over {handshakes} connections ({reused} reused, {reconnects} reconnects), {seconds:.2f}s in HTTP.".format(**delta)
+
+_POOL = _ConnectionPool(timeout=60) # a CA that stops answering is a transient error (see _do_request), not a hang
+
 # helper functions - base64 encode for jose spec
 def _b64(bytestring):
     return base64.urlsafe_b64encode(bytestring).decode('utf8').replace("=", "")
 
-# helper function - make request and automatically parse json response
-def _do_request(url, data=None, err_msg="Error", depth=0):
-    try:
-        resp = urlopen(Request(url, data=data, headers={"Content-Type": "application/jose+json", "User-Agent": "acmectl"}))
-        resp_data, resp_code, headers = resp.read().decode("utf8"), resp.getcode(), resp.headers
-    except IOError as error:
-        resp_data = error.read().decode("utf8") if hasattr(error, "read") else str(error)
-        resp_code, headers = getattr(error, "code", None), {}
+# helper functions - minimal DER/PEM reading (just enough for RSA private keys)
+def _der_read(data, offset=0):
+    if offset + 2 > len(data):
+        raise ValueError("Truncated DER")
+    tag, length, offset = data[offset], data[offset + 1], offset + 2
+    if length & 0x80:
+        size = length & 0x7f
+        length, offset = int.from_bytes(data[offset:offset + size], "big"), offset + size
+    if offset + length > len(data):
+        raise ValueError("Truncated DER")
+    return tag, data[offset:offset + length], offset + length
+
+def _der_items(data):
+    items, offset = [], 0
+    while offset < len(data):
+        tag, value, offset = _der_read(data, offset)
+        items.append((tag, value))
+    return items
+
+def _pem_to_der(pem):
+    m = re.search(r"-----BEGIN ([A-Z0-9 ]+)-----(.+?)-----END \1-----", pem, re.DOTALL)
+    if m is None:
+        raise ValueError("No PEM block found")
+    if "ENCRYPTED" in m.group(1) or "Proc-Type:" in m.group(2):
+        raise ValueError("Encrypted PEM is not supported")
+    return m.group(1), base64.b64decode(m.group(2))
+
+# helper function - public JWK of an unencrypted RSA private key (PKCS#1 or PKCS#8 PEM)
+def _rsa_jwk(pem):
+    label, der = _pem_to_der(pem)
+    items = _der_items(_der_read(der)[1])
+    if label == "PRIVATE KEY": # PKCS#8 wrapper around an RSAPrivateKey
+        if _der_items(items[1][1])[0][1] != bytes.fromhex("2a864886f70d010101"): # rsaEncryption
+            raise ValueError("Not an RSA key")
+        items = _der_items(_der_read(items[2][1])[1])
+    elif label != "RSA PRIVATE KEY":
+        raise ValueError("Unsupported key type: {0}".format(label))
+    return {"e": _b64(items[2][1].lstrip(b"\x00")), "kty": "RSA", "n": _b64(items[1][1].lstrip(b"\x00"))}
+
+# helper function - read a certificate (first one in the file) or CSR, PEM or DER, once per distinct content.
+# Returns a dict with the DER bytes, subject CN, DNS SANs, public key type and, for certificates, the serial
+# (DER integer bytes), authority key identifier and notBefore/notAfter (epoch seconds).
+_X509, _X509_LOCK = {}, threading.Lock()
+_OIDS = {"550403": "cn", "551d11": "san", "551d23": "aki", "2a864886f70d01090e": "extensionRequest",
+         "2a864886f70d010101": "rsa", "2a8648ce3d0201": "ecdsa", "2b6570": "ed25519", "2b6571": "ed448"}
+
+def _der_time(tag, value):
+    value = value.decode("ascii")
+    if tag == 0x17: # UTCTime, two-digit years 50-99 are 19xx
+        value = ("19" if value[:2] >= "50" else "20") + value
+    return int(datetime.datetime.strptime(value, "%Y%m%d%H%M%SZ").replace(tzinfo=datetime.timezone.utc).timestamp())
+
+def _load_x509(path):
+    # a path, or the PEM or DER itself as bytes
+    if isinstance(path, bytes):
+        data, path = path, "(in memory)"
+    else:
+        with open(path, "rb") as file:
+            data = file.read()
+    digest = hashlib.sha256(data).digest()
+    with _X509_LOCK:
+        if digest in _X509:
+            return _X509[digest]
+
     try:
-        resp_data = json.loads(resp_data) # try to parse json results
-    except ValueError:
-        pass # ignore json parsing errors
-    if depth < 100 and resp_code == 400 and resp_data['type'] == "urn:ietf:params:acme:error:badNonce":
-        raise IndexError(resp_data) # allow 100 retries for bad nonces
-    if resp_code not in [200, 201, 204]:
-        raise ValueError("{0}:\nUrl: {1}\nData: {2}\nResponse Code: {3}\nResponse: {4}".format(err_msg, url, data, resp_code, resp_data))
-    return resp_data, resp_code, headers
+        info = _parse_x509(_pem_to_der(data.decode("ascii", "replace"))[1] if b"-----BEGIN" in data else data)
+    except (IndexError, ValueError, UnicodeDecodeError, binascii.Error) as error:
+        raise ValueError("Malformed certificate or CSR {0}: {1}".format(path, error))
+    with _X509_LOCK:
+        _X509[digest] = info
+    return info
+
+# the TBSCertificate of a certificate or the CertificationRequestInfo of a CSR, pulled apart by position
+def _parse_x509(der):
+    body = _der_items(_der_read(der)[1])[0][1] # TBSCertificate / CertificationRequestInfo
+    items = _der_items(body)
+    info = {"der": der, "cn": None, "sans": [], "key_type": None}
+    if len(items) >= 6: # certificate: [0] version (not in v1), serial, signature, issuer, validity, subject, spki, ..., [3] extensions
+        items = items[1:] if items[0][0] == 0xa0 else items
+        info["serial"] = items[0][1]
+        info["not_before"], info["not_after"] = [_der_time(tag, value) for tag, value in _der_items(items[3][1])]
+        subject, spki = items[4][1], items[5][1]
+        extensions = [value for tag, value in items[6:] if tag == 0xa3]
+        extensions = _der_items(_der_read(extensions[0])[1]) if extensions else []
+    else: # CSR: version, subject, spki, [0] attributes (extensions are in the extensionRequest attribute)
+        subject, spki = items[1][1], items[2][1]
+        extensions = []
+        for tag, value in (_der_items(items[3][1]) if len(items) > 3 and items[3][0] == 0xa0 else []):
+            attribute = _der_items(value)
+            if _OIDS.get(attribute[0][1].hex()) == "extensionRequest":
+                extensions = _der_items(_der_read(attribute[1][1])[1])
+
+    for rdn in _der_items(subject):
+        for tag, value in _der_items(rdn[1]):
+            oid, name = _der_items(value)[:2]
+            if _OIDS.get(oid[1].hex()) == "cn":
+                info["cn"] = name[1].decode("utf8")
+    algorithm = _der_items(_der_items(spki)[0][1])[0][1].hex()
+    info["key_type"] = _OIDS.get(algorithm, algorithm)
+    for tag, value in extensions:
+        extension = _der_items(value)
+        kind, content = _OIDS.get(extension[0][1].hex()), extension[-1][1] # the optional critical flag sits in between
+        if kind == "san":
+            info["sans"] = [name.decode("ascii") for tag, name in _der_items(_der_read(content)[1]) if tag == 0x82] # dNSName
+        elif kind == "aki":
+            info["aki"] = next((key_id for tag, key_id in _der_items(_der_read(content)[1]) if tag == 0x80), None) # keyIdentifier
+    return info
+
+# === Signers ===
+# The account key is loaded once per process and every JWS is signed through libcrypto in-process.
+# Keys libcrypto can't load non-interactively (e.g. encrypted) fall back to forking `openssl dgst`
+# per request, as acme-hooked always did. Either way OpenSSL remains the only crypto we trust.
+class _LibcryptoSigner:
+    """RS256 via the system libcrypto (ctypes); the key is parsed once and no process is forked per signature."""
+    alg = "RS256"
+
+    def __init__(self, pem):
+        self.jwk = _rsa_jwk(pem)
+        lib = ctypes.CDLL(ctypes.util.find_library("crypto") or "libcrypto.so")
+        for name in ["BIO_new_mem_buf", "PEM_read_bio_PrivateKey", "EVP_sha256", "EVP_MD_CTX_new"]:
+            getattr(lib, name).restype = ctypes.c_void_p
+        lib.BIO_new_mem_buf.argtypes = [ctypes.c_char_p, ctypes.c_int]
+        lib.BIO_free.argtypes = [ctypes.c_void_p]
+        lib.PEM_read_bio_PrivateKey.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_char_p]
+        lib.EVP_MD_CTX_free.argtypes = [ctypes.c_void_p]
+        lib.EVP_DigestSignInit.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]
+        lib.EVP_DigestSign.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_size_t), ctypes.c_char_p, ctypes.c_size_t]
+        pem_bytes = pem.encode("utf8") # BIO_new_mem_buf doesn't copy, keep the buffer alive while reading
+        bio = lib.BIO_new_mem_buf(pem_bytes, len(pem_bytes))
+        self.pkey = lib.PEM_read_bio_PrivateKey(bio, None, None, b"") # empty passphrase: fail instead of prompting
+        lib.BIO_free(bio)
+        if not self.pkey:
+            raise ValueError("libcrypto could not load the account key")
+        self.lib = lib
+
+    def sign(self, data):
+        ctx = self.lib.EVP_MD_CTX_new()
+        try:
+            size = ctypes.c_size_t(0)
+            if self.lib.EVP_DigestSignInit(ctx, None, self.lib.EVP_sha256(), None, self.pkey) != 1 or \
+                    self.lib.EVP_DigestSign(ctx, None, ctypes.byref(size), data, len(data)) != 1:
+                raise IOError("OpenSSL Error\nEVP_DigestSign failed")
+            sig = ctypes.create_string_buffer(size.value)
+            if self.lib.EVP_DigestSign(ctx, sig, ctypes.byref(size), data, len(data)) != 1:
+                raise IOError("OpenSSL Error\nEVP_DigestSign failed")
+            return sig.raw[:size.value]
+        finally:
+            self.lib.EVP_MD_CTX_free(ctx)
+
+class _OpenSSLSigner:
+    """RS256 by forking `openssl dgst` for every signature."""
+    alg = "RS256"
+
+    def __init__(self, account_key):
+        self.account_key = account_key
+        out = _cmd(["openssl", "rsa", "-in", account_key, "-noout", "-text"], err_msg="OpenSSL Error")
+        pub_pattern = r"modulus:[\s]+?00:([a-f0-9\:\s]+?)\npublicExponent: ([0-9]+)"
+        pub_hex, pub_exp = re.search(pub_pattern, out.decode('utf8'), re.MULTILINE | re.DOTALL).groups()
+        pub_exp = "{0:x}".format(int(pub_exp))
+        pub_exp = "0{0}".format(pub_exp) if len(pub_exp) % 2 else pub_exp
+        self.jwk = {
+            "e": _b64(binascii.unhexlify(pub_exp.encode("utf-8"))),
+            "kty": "RSA",
+            "n": _b64(binascii.unhexlify(re.sub(r"(\s|:)", "", pub_hex).encode("utf-8"))),
+        }
+
+    def sign(self, data):
+        return _cmd(["openssl", "dgst", "-sha256", "-sign", self.account_key], stdin=subprocess.PIPE, cmd_input=data, err_msg="OpenSSL Error")
+
+_SIGNERS, _SIGNERS_LOCK = {}, threading.Lock()
+
+# helper function - get the (cached) signer for an account key file
+def _get_signer(account_key):
+    with _SIGNERS_LOCK:
+        if account_key not in _SIGNERS:
+            try:
+                with open(account_key) as f:
+                    _SIGNERS[account_key] = _LibcryptoSigner(f.read())
+            except (OSError, ValueError, IndexError, AttributeError) as error:
+                LOGGER.info("Signing with openssl subprocess (%s).", error)
+                _SIGNERS[account_key] = _OpenSSLSigner(account_key)
+        return _SIGNERS[account_key]
+
+# === Request governor ===
+# _do_request retries what is worth retrying: badNonce right away with a fresh nonce (up to NONCE_RETRIES times),
+# rateLimited/429, 5xx and network errors after the server's Retry-After or an exponential backoff (up to RETRIES
+# times). A Retry-After longer than RETRY_WAIT isn't waited out: the url is blocked until then (for later runs too,
+# with a state file) and the error raised, so the work is deferred instead of hammering the CA. Server errors block
+# the url for everyone; rate limits only for the account, and on newOrder only for the order's identifiers if the
+# CA names one of them (a per-domain limit), so other accounts and domains carry on.
+# Token buckets also budget the requests CAs limit per account (or, for newAccount, per client), so bulk renewals slow
+# down (waiting up to RETRY_WAIT for a token) or are deferred before the CA starts refusing them. The default budgets are Let's Encrypt's limits,
+# the strictest of the common CAs (https://letsencrypt.org/docs/rate-limits/).
+RETRIES, NONCE_RETRIES, RETRY_WAIT = 4, 10, 300
+RATE_LIMITS = {"newOrder": (300, 3 * 3600), "newAccount": (10, 3 * 3600), "failedValidation": (5, 3600)} # burst, seconds to refill it
+_LIMITS, _LIMITS_LOCK = {"file": None, "buckets": {}, "blocked": {}}, threading.RLock()
+
+def _load_limits(state_file):
+    with _LIMITS_LOCK:
+        if _LIMITS["file"] != state_file: # once per process, after that the file is kept up to date from memory
+            state = _load_json(state_file)
+            _LIMITS.update(file=state_file, buckets=state.get("buckets", {}), blocked=state.get("blocked", {}))
+
+def _save_limits():
+    # only what still matters is kept: buckets that haven't refilled yet and blocks that haven't expired
+    with _LIMITS_LOCK:
+        now = time.time()
+        for key, bucket in list(_LIMITS["buckets"].items()):
+            burst, period = RATE_LIMITS.get(key.split(" ")[1], (0, 1))
+            if bucket["tokens"] + (now - bucket["updated"]) * burst / period >= burst:
+                del _LIMITS["buckets"][key]
+        if _LIMITS["file"]:
+            _save_json(_LIMITS["file"], {"buckets": _LIMITS["buckets"], "blocked": {url: until for url, until in _LIMITS["blocked"].items() if until > now}})
+
+_ACCOUNT_IDS = {}
+
+def _account_id(account_key):
+    if account_key not in _ACCOUNT_IDS:
+        with open(account_key, "rb") as file:
+            _ACCOUNT_IDS[account_key] = hashlib.sha256(file.read()).hexdigest()[:16]
+    return _ACCOUNT_IDS[account_key]
+
+def _bucket_key(directory_url, budget, subject, account_key):
+    # "<directory url>[#<account>] <budget> [<identifier>]": per account if an account key is given
+    return " ".join(filter(None, [directory_url + ("#" + _account_id(account_key) if account_key else ""), budget, subject]))
+
+# helper function - the keys a url can be blocked under, widest first: "<url>", "<url>#<account>" and, for
+# newOrder, "<url>#<account> <identifiers>"
+def _block_keys(url, account=None, identifiers=None):
+    keys = [url]
+    if account:
+        keys.append(url + "#" + account)
+        if identifiers:
+            keys.append(keys[-1] + " " + ",".join(sorted(identifiers)))
+    return keys
+
+def _bucket(key, budget):
+    # the token bucket of a budget, refilled up to now, and its refill rate
+    burst, period = RATE_LIMITS[budget]
+    now = time.time()
+    bucket = _LIMITS["buckets"].get(key, {"tokens": burst, "updated": now})
+    bucket.update(tokens=min(burst, bucket["tokens"] + (now - bucket["updated"]) * burst / period), updated=now)
+    return bucket, burst / period
+
+def rate_budget(directory_url, budget, subject=None, state_file=None, account_key=None):
+    """How many requests of a budget ("newOrder", "newAccount", "failedValidation" of an identifier) fit right now,
+    for the account of account_key (newOrder, failedValidation) or this client (newAccount)."""
+    with _LIMITS_LOCK:
+        if state_file:
+            _load_limits(state_file)
+        return max(0, int(_bucket(_bucket_key(directory_url, budget, subject, account_key), budget)[0]["tokens"]))
+
+def _take(directory_url, budget, subject=None, wait=True, account_key=None):
+    # spend a token, first waiting up to RETRY_WAIT for one to come in; raises ValueError if that takes longer.
+    # wait=False spends it regardless (for failures, which are only counted after the fact)
+    key = _bucket_key(directory_url, budget, subject, account_key)
+    with _LIMITS_LOCK:
+        bucket, rate = _bucket(key, budget)
+        delay = (1 - bucket["tokens"]) / rate if wait else 0
+        if delay > RETRY_WAIT:
+            failure = ValueError("The {0} budget{1} is exhausted for another {2:.0f}s, deferring".format(budget, " of " + subject if subject else "", delay))
+            failure.status, failure.problem, failure.subject = None, "urn:ietf:params:acme:error:rateLimited", subject
+            raise failure
+        bucket["tokens"] -= 1
+        _LIMITS["buckets"][key] = bucket
+        _save_limits()
+    if delay > 0:
+        LOGGER.info("Waiting %.0fs to stay within the %s budget.", delay, budget)
+        time.sleep(delay)
+
+# helper function - what to do about an error response: "nonce" (retry with a fresh nonce), "transient" (retry
+# later) or None (give up)
+def _classify(resp_code, resp_data):
+    problem = resp_data.get('type') if isinstance(resp_data, dict) else None
+    if problem == "urn:ietf:params:acme:error:badNonce":
+        return "nonce"
+    if resp_code is None or resp_code == 429 or resp_code >= 500 or problem == "urn:ietf:params:acme:error:rateLimited":
+        return "transient"
+    return None
+
+# helper function - make request and automatically parse json response
+# `data` may be a function returning the body, so that every attempt of a signed request is signed with a fresh
+# nonce. With a `nonce` stack, the Replay-Nonce of every response (error responses included) is pushed onto it.
+# Errors carry the response's `status` and problem type (`problem`), and `subject` (the identifiers) if they are
+# about the order's identifiers only.
+def _do_request(url, data=None, err_msg="Error", nonce=None, account=None, identifiers=None):
+    with _span("request", url=url) as span:
+        attempts, redirects = {"nonce": 0, "transient": 0}, 0
+        while True:
+            keys = _block_keys(url, account, identifiers)
+            blocked, key = max((_LIMITS["blocked"].get(key, 0), key) for key in keys)
+            if blocked > time.time():
+                failure = ValueError("{0}:\nUrl: {1}\nRate limited by the server until {2}, deferring".format(err_msg, url, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(blocked))))
+                failure.status, failure.problem, failure.subject = 429, "urn:ietf:params:acme:error:rateLimited", key.partition(" ")[2] or None
+                raise failure
+            body = data() if callable(data) else data
+            try:
+                resp_code, headers, resp_data = _POOL.request("GET" if body is None else "POST", url, body=body, headers={"Content-Type": "application/jose+json", "User-Agent": "acmectl"})
+                resp_data = resp_data.decode("utf8")
+            except (IOError, http.client.HTTPException) as error:
+                resp_data, resp_code, headers = str(error), None, {}
+            if nonce is not None and 'Replay-Nonce' in headers:
+                nonce.append(headers['Replay-Nonce'])
+            if body is None and resp_code in [301, 302, 303, 307, 308] and 'Location' in headers:
+                # follow redirects for plain GETs like urlopen did, up to the same 10
+                if redirects >= 10:
+                    failure = ValueError("{0}:\nUrl: {1}\nToo many redirects".format(err_msg, url))
+                    failure.status, failure.problem, failure.subject = resp_code, None, None
+                    raise failure
+                url, redirects = urljoin(url, headers['Location']), redirects + 1
+                _count("redirect", url=url)
+                continue
+            try:
+                resp_data = json.loads(resp_data) # try to parse json results
+            except ValueError:
+                pass # ignore json parsing errors
+            span["status"] = resp_code
+            if resp_code in [200, 201, 204]:
+                return resp_data, resp_code, headers
+
+            error = "{0}:\nUrl: {1}\nData: {2}\nResponse Code: {3}\nResponse: {4}".format(err_msg, url, body, resp_code, resp_data)
+            kind = _classify(resp_code, resp_data)
+            problem = resp_data.get('type') if isinstance(resp_data, dict) else None
+            if kind is None or attempts[kind] >= (NONCE_RETRIES if kind == "nonce" else RETRIES):
+                failure = ValueError(error)
+                failure.status, failure.problem, failure.subject = resp_code, problem, None
+                raise failure
+            delay = 0 if kind == "nonce" else _poll_delay(headers, attempts[kind])
+            if delay > RETRY_WAIT:
+                # what to block: a down server for everyone, a rate limit for the account, or just for these
+                # identifiers if the CA's message names one of them
+                detail = str(resp_data.get('detail', '')) if isinstance(resp_data, dict) else ""
+                rate_limited = resp_code == 429 or problem == "urn:ietf:params:acme:error:rateLimited"
+                if not rate_limited:
+                    key = keys[0]
+                elif identifiers and any(identifier in detail for identifier in identifiers):
+                    key = keys[-1]
+                else:
+                    key = keys[1] if account else keys[0]
+                with _LIMITS_LOCK:
+                    _LIMITS["blocked"][key] = time.time() + delay
+                    _save_limits()
+                failure = ValueError("{0}\nRetry after {1:.0f}s, deferring".format(error, delay))
+                failure.status, failure.problem, failure.subject = resp_code, problem, key.partition(" ")[2] or None
+                raise failure
+            attempts[kind] += 1
+            _count("bad_nonce" if kind == "nonce" else "retry", url=url, status=resp_code, delay=round(delay, 3))
+            LOGGER.info("%s (%s), retrying in %.1fs.", err_msg, resp_data.get('type', resp_code) if isinstance(resp_data, dict) else resp_code or resp_data, delay)
+            time.sleep(delay)
 
 # helper function - make signed requests
-def _send_signed_request(url, payload, err_msg, directory, jwk, alg, acct_headers, account_key, nonce, depth=0):
+# `nonce` is a shared stack of unused nonces: every request pops one (or fetches a fresh one if it's empty)
+# and pushes the one it gets back, so concurrent workers never sign with the same nonce.
+def _send_signed_request(url, payload, err_msg, directory, jwk, alg, acct_headers, account_key, nonce):
     payload64 = "" if payload is None else _b64(json.dumps(payload).encode('utf8'))
-    new_nonce = _do_request(directory['newNonce'])[2].get('Replay-Nonce') if nonce[0] is None else nonce[0]
-    protected = {"url": url, "alg": alg, "nonce": new_nonce}
-    protected.update({"jwk": jwk} if acct_headers is None else {"kid": acct_headers['Location']})
-    protected64 = _b64(json.dumps(protected).encode('utf8'))
-    protected_input = "{0}.{1}".format(protected64, payload64).encode('utf8')
-    out = _cmd(["openssl", "dgst", "-sha256", "-sign", account_key], stdin=subprocess.PIPE, cmd_input=protected_input, err_msg="OpenSSL Error")
-    data = json.dumps({"protected": protected64, "payload": payload64, "signature": _b64(out)})
-    try:
-        resp_data, resp_code, headers = _do_request(url, data=data.encode('utf8'), err_msg=err_msg, depth=depth)
-        # Cache the nonce for the next request (every successful response carries one)
-        if 'Replay-Nonce' in headers:
-            nonce[0] = headers['Replay-Nonce']
-        return resp_data, resp_code, headers
-    except IndexError:  # badNonce
-        nonce[0] = None  # force fresh nonce on retry
-        return _send_signed_request(url, payload, err_msg, directory, jwk, alg, acct_headers, account_key, nonce, depth=(depth + 1))
-
-# helper function - poll until complete
-# Accepts optional sender (3-arg callable) so sign_crts can pass a context-closing wrapper.
-def _poll_until_not(url, pending_statuses, err_msg, sender=None):
-    if sender is None:
-        sender = lambda u, p, e: _send_signed_request(u, p, e, None, None, None, None, None, [None])
-    result, _, _ = sender(url, None, err_msg)
-    start_time = time.time()
-    while result['status'] in pending_statuses:
-        assert (time.time() - start_time < 3600), "Polling timeout" # 1 hour timeout
-        time.sleep(2)
-        result, _, _ = sender(url, None, err_msg)
-    return result
+    def sign():
+        try:
+            new_nonce = nonce.pop() # list.pop/append are atomic, no lock needed
+        except IndexError:
+            _count("nonce_fetch")
+            new_nonce = _do_request(directory['newNonce'])[2].get('Replay-Nonce')
+        protected = {"url": url, "alg": alg, "nonce": new_nonce}
+        protected.update({"jwk": jwk} if acct_headers is None else {"kid": acct_headers['Location']})
+        protected64 = _b64(json.dumps(protected).encode('utf8'))
+        protected_input = "{0}.{1}".format(protected64, payload64).encode('utf8')
+        with _span("sign", alg=alg):
+            signature = _get_signer(account_key).sign(protected_input)
+        return json.dumps({"protected": protected64, "payload": payload64, "signature": _b64(signature)}).encode('utf8')
+    identifiers = [i['value'] for i in payload['identifiers']] if isinstance(payload, dict) and 'identifiers' in payload else None # newOrder
+    return _do_request(url, data=sign, err_msg=err_msg, nonce=nonce, account=_account_id(account_key), identifiers=identifiers)
+
+# helper function - seconds to wait before the next poll: the server's Retry-After if it sent one,
+# otherwise exponential backoff (1s, 2s, 4s... capped at 30s) with jitter
+def _poll_delay(headers, attempt, base=1.0, cap=30.0):
+    retry_after = headers.get('Retry-After') if headers else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+# Polls many resources at once (the only polling path): requests run on `executor`, waits are kept in a heap instead of blocking
+# a worker, and iterating yields (key, result) as soon as each resource leaves its pending statuses.
+# Jobs may be added while iterating (e.g. an order once it has been finalized).
+class _Poller:
+    def __init__(self, sender, executor, timeout=3600):
+        self.sender, self.executor, self.timeout = sender, executor, timeout
+        self.due, self.inflight, self.seq = [], {}, itertools.count()
+
+    def add(self, key, url, pending_statuses, err_msg):
+        job = {"key": key, "url": url, "pending": pending_statuses, "err_msg": err_msg, "start": time.time(), "attempt": 0}
+        heapq.heappush(self.due, (time.time(), next(self.seq), job))
+
+    def __iter__(self):
+        while self.due or self.inflight:
+            while self.due and self.due[0][0] <= time.time():
+                job = heapq.heappop(self.due)[2]
+                self.inflight[self.executor.submit(self.sender, job['url'], None, job['err_msg'])] = job
+            timeout = max(0.0, self.due[0][0] - time.time()) if self.due else None
+            if not self.inflight:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(list(self.inflight), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = self.inflight.pop(future)
+                result, _, headers = future.result()
+                if result['status'] not in job['pending']:
+                    _record_span("poll", time.time() - job['start'], url=job['url'], polls=job['attempt'] + 1, status=result['status'])
+                    yield job['key'], result
+                    continue
+                assert (time.time() - job['start'] < self.timeout), "Polling timeout" # 1 hour timeout
+                _count("poll_iteration", url=job['url'])
+                heapq.heappush(self.due, (time.time() + _poll_delay(headers, job['attempt']), next(self.seq), job))
+                job['attempt'] += 1
+
+# === DNS-01 propagation check ===
+# Instead of the hook's `check`, acme_hooked can look up every _acme-challenge TXT record itself, all at once,
+# on several resolvers: DoH JSON endpoints (https://1.1.1.1/dns-query, https://dns.google/resolve, ...) or
+# plain DNS servers such as the zone's authoritative nameservers (dns://ns1.example.net[:53]).
+# A record counts as propagated once `quorum` resolvers return it.
+
+# helper function - skip a (possibly compressed) domain name in a DNS message
+def _dns_skip_name(data, offset):
+    while data[offset] != 0:
+        if data[offset] & 0xc0 == 0xc0:
+            return offset + 2
+        offset += data[offset] + 1
+    return offset + 1
+
+# helper function - TXT lookup over UDP
+def _dns_udp_txt(host, port, name, timeout=5):
+    query_id = random.getrandbits(16)
+    qname = b"".join(bytes([len(label)]) + label.encode("ascii") for label in name.rstrip(".").split(".")) + b"\x00"
+    family, socktype, proto, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+    with socket.socket(family, socktype, proto) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + qname + struct.pack(">HH", 16, 1), address)
+        data = sock.recv(4096)
+    response_id, _, _, answers, _, _ = struct.unpack(">HHHHHH", data[:12])
+    if response_id != query_id:
+        raise IOError("DNS response ID mismatch from {0}".format(host))
+    offset, records = _dns_skip_name(data, 12) + 4, set()
+    for _ in range(answers):
+        offset = _dns_skip_name(data, offset)
+        rtype, _, _, rdlength = struct.unpack(">HHIH", data[offset:offset + 10])
+        rdata, offset = data[offset + 10:offset + 10 + rdlength], offset + 10 + rdlength
+        if rtype == 16: # TXT: one or more <length><string> chunks
+            txt, i = b"", 0
+            while i < len(rdata):
+                txt, i = txt + rdata[i + 1:i + 1 + rdata[i]], i + 1 + rdata[i]
+            records.add(txt.decode("utf8", "replace"))
+    return records
+
+# helper function - TXT lookup on a DoH JSON endpoint or dns:// server
+def _dns_txt(resolver, name):
+    parts = urlsplit(resolver)
+    if parts.scheme == "dns":
+        return _dns_udp_txt(parts.hostname, parts.port or 53, name)
+    status, _, data = _POOL.request("GET", "{0}?name={1}&type=TXT".format(resolver, quote(name)), headers={"Accept": "application/dns-json", "User-Agent": "acmectl"})
+    if status != 200:
+        raise IOError("DoH query to {0} failed with {1}".format(resolver, status))
+    answers = json.loads(data.decode("utf8")).get("Answer", [])
+    return set("".join(re.findall(r'"((?:[^"\\]|\\.)*)"', a["data"])) or a["data"] for a in answers if a.get("type") == 16)
+
+def _check_dns_propagation(records, resolvers, quorum=None, concurrency=DEFAULT_CONCURRENCY, timeout=3600):
+    """Wait until each (domain, content) TXT record is visible on `quorum` resolvers (default: a majority).
+    Returns an IOError or None for each record, like _Hook.call_many."""
+    quorum, started = quorum or len(resolvers) // 2 + 1, time.time()
+
+    def _lookup(domain, _, content):
+        name = "_acme-challenge.{0}".format(domain[2:] if domain.startswith("*.") else domain)
+        seen = 0
+        for resolver in resolvers:
+            try:
+                seen += content in _dns_txt(resolver, name)
+            except (IOError, ValueError, KeyError, IndexError, struct.error) as error:
+                LOGGER.debug("Lookup of %s on %s failed: %s", name, resolver, error)
+        if seen >= quorum:
+            return {"status": "valid", "seen": seen}, None, {}
+        return {"status": "pending" if time.time() - started < timeout else "timeout", "seen": seen}, None, {}
+
+    errors = [None] * len(records)
+    with _span("dns_wait", records=len(records), resolvers=len(resolvers)), ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        poller = _Poller(_lookup, executor, timeout=timeout + 60)
+        for i, (domain, content) in enumerate(records):
+            poller.add(i, domain, ["pending"], content)
+        for i, result in poller:
+            domain = records[i][0]
+            if result['status'] == "valid":
+                LOGGER.info("TXT record for %s visible on %d/%d resolvers after %.1fs.", domain, result['seen'], len(resolvers), time.time() - started)
+            else:
+                LOGGER.error("TXT record for %s only visible on %d/%d resolvers after %.1fs.", domain, result['seen'], len(resolvers), time.time() - started)
+                errors[i] = IOError("DNS Check Error\n{0} not propagated".format(domain))
+    return errors
 
 def list_profiles(directory_url=DEFAULT_DIRECTORY_URL):
     """Informative command: print supported profiles."""
@@ -99,181 +871,649 @@ def list_profiles(directory_url=DEFAULT_DIRECTORY_URL):
     for name, desc in profiles.items():
         LOGGER.info(f"  {name}: {desc}")
 
+def cert_info(cert_path):
+    """Return validity (epoch seconds), SANs, key type, serial and ARI CertID of a PEM certificate (a path, or the
+    PEM itself as bytes, e.g. one sign_crts returned)."""
+    info = _load_x509(cert_path)
+    if "serial" not in info:
+        raise ValueError("{0} is not a certificate".format(cert_path if isinstance(cert_path, str) else "PEM"))
+    return {
+        "not_before": info["not_before"],
+        "not_after": info["not_after"],
+        "sans": info["sans"],
+        "key_type": info["key_type"],
+        "serial": info["serial"].hex().upper(),
+        "cert_id": "{0}.{1}".format(_b64(info["aki"]), _b64(info["serial"])) if info.get("aki") else None,
+    }
+
 def get_cert_id(cert_path):
     """Return the ARI CertID (RFC 9773) for a PEM certificate."""
-
-    # AKI keyIdentifier
-    out = _cmd(["openssl", "x509", "-in", cert_path, "-noout", "-ext", "authorityKeyIdentifier"], err_msg="Failed to read AKI")
-    m = re.search(r"([0-9a-fA-F]{2}:)+[0-9a-fA-F]{2}", out.decode("utf8"), re.DOTALL)
-    if not m:
+    cert_id = cert_info(cert_path)["cert_id"]
+    if not cert_id:
         raise ValueError("No Authority Key Identifier found in certificate")
-    aki_bytes = binascii.unhexlify(m.group(0).replace(":", ""))
-    # Serial number (including any leading zero byte required by DER)
-    out = _cmd(["openssl", "x509", "-in", cert_path, "-noout", "-serial"],
-               err_msg="Failed to read serial")
-    serial_hex = out.decode("utf8").strip().split("=", 1)[1]
-    serial_bytes = binascii.unhexlify(serial_hex)
-    
-    return f"{_b64(aki_bytes)}.{_b64(serial_bytes)}"
-
-def sign_crts(account_key, csr, disable_check=False, directory_url=DEFAULT_DIRECTORY_URL, contact=None, hook=None, challenge_type=None, profile=None, replaces=None):
-    crts, requests, orders, directory, acct_headers, alg, jwk, nonce = [], [], [], None, None, None, None, [None] # nonce is mutable list for reuse across signed requests
-
-    # parse account key to get public key
-    LOGGER.info("Parsing account key.")
-    out = _cmd(["openssl", "rsa", "-in", account_key, "-noout", "-text"], err_msg="OpenSSL Error")
-    pub_pattern = r"modulus:[\s]+?00:([a-f0-9\:\s]+?)\npublicExponent: ([0-9]+)"
-    pub_hex, pub_exp = re.search(pub_pattern, out.decode('utf8'), re.MULTILINE | re.DOTALL).groups()
-    pub_exp = "{0:x}".format(int(pub_exp))
-    pub_exp = "0{0}".format(pub_exp) if len(pub_exp) % 2 else pub_exp
-    alg = "RS256"
-    jwk = {
-        "e": _b64(binascii.unhexlify(pub_exp.encode("utf-8"))),
-        "kty": "RSA",
-        "n": _b64(binascii.unhexlify(re.sub(r"(\s|:)", "", pub_hex).encode("utf-8"))),
-    }
-    accountkey_json = json.dumps(jwk, sort_keys=True, separators=(',', ':'))
-    thumbprint = _b64(hashlib.sha256(accountkey_json.encode('utf8')).digest())
+    return cert_id
 
-    # get the ACME directory of urls
-    LOGGER.info("Getting directory.")
-    directory, _, _ = _do_request(directory_url, err_msg="Error getting directory")
-    LOGGER.info("Directory found.")
-
-    # Obtain a nonce once up front; subsequent responses will supply the next nonce (optimization)
-    nonce[0] = _do_request(directory['newNonce'])[2].get('Replay-Nonce')
-
-    # create account, update contact details (if any), and set the global key identifier
-    LOGGER.info("Registering account.")
-    reg_payload = {"termsOfServiceAgreed": True}
-    if contact is not None:
-        reg_payload.update({"contact": contact})
-    # newAccount uses acct_headers=None (triggers jwk instead of kid) + the pre-fetched nonce list
-    account, resp_code, acct_headers = _send_signed_request(directory['newAccount'], reg_payload, "Error registering", directory, jwk, alg, None, account_key, nonce)
-    LOGGER.info("Registered." if resp_code == 201 else "Already registered.")
-    if contact is not None and resp_code != 201 and not set(contact) == set(account['contact']):
-        account, _, _ = _send_signed_request(acct_headers['Location'], {"contact": contact}, "Error updating contact details", directory, jwk, alg, acct_headers, account_key, nonce)
-        LOGGER.info("Updated contact details: %s.", "; ".join(account['contact']))
-
-    # Local short-form sender (closes over directory/jwk/alg/acct_headers/account_key/nonce).
-    # All post-account signed requests (newOrder, auths, challenges, finalize, downloads) use this.
-    def _send(url, payload, err_msg):
-        return _send_signed_request(url, payload, err_msg, directory, jwk, alg, acct_headers, account_key, nonce)
+def _load_json(path):
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
 
-    # find domains
-    for csrfile in csr:
-        LOGGER.info("Parsing CSR %s.", csrfile)
-        out = _cmd(["openssl", "req", "-in", csrfile, "-noout", "-text"], err_msg="Error loading {0}".format(csrfile))
-        domains = set([])
-        common_name = re.search(r"Subject:.*? CN\s?=\s?([^\s,;/]+)", out.decode('utf8'))
-        if common_name is not None:
-            domains.add(common_name.group(1))
-        subject_alt_names = re.search(r"X509v3 Subject Alternative Name: (?:critical)?\n +([^\n]+)\n", out.decode('utf8'), re.MULTILINE | re.DOTALL)
-        if subject_alt_names is not None:
-            for san in subject_alt_names.group(1).split(", "):
-                if san.startswith("DNS:"):
-                    domains.add(san[4:])
-        LOGGER.info("Found domains: %s.", ", ".join(domains))
-
-        # create a new order
-        LOGGER.info("Creating new order.")
-        order_payload = {"identifiers": [{"type": "dns", "value": d} for d in domains]}
-        if profile:
-            order_payload["profile"] = profile
-            LOGGER.info("Requesting profile: %s", profile)
-        if replaces:
-            order_payload["replaces"] = replaces
-            LOGGER.info("Requesting replacement of CertID: %s", replaces)
-
-        order, _, order_headers = _send(directory['newOrder'], order_payload, "Error creating new order")
-        LOGGER.info("Order created. Server selected profile: %s", order['profile']) if 'profile' in order else LOGGER.info("Order created.")
-        orders += [(order, order_headers, csrfile)]
-
-        # get the authorizations that need to be completed
-        for auth_url in order['authorizations']:
-            authorization, _, _ = _send(auth_url, None, "Error getting challenges")
-            domain = authorization['identifier']['value']
-            if authorization['status'] == 'valid':
-                LOGGER.info("Domain %s already verified. Skipping.", domain)
+def _save_file(path, text):
+    # write-then-rename so a crash can't leave a truncated file behind, and readers never see half of one
+    with open(path + ".tmp", "w") as file:
+        file.write(text)
+    os.replace(path + ".tmp", path)
+
+def _save_json(path, data):
+    _save_file(path, json.dumps(data, indent=1, sort_keys=True))
+
+def _parse_time(value):
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+def renewal_info(cert_ids, directory_url=DEFAULT_DIRECTORY_URL, cache_file=None, concurrency=DEFAULT_CONCURRENCY):
+    """Return {cert_id: {"window", "renew_at", "explanation", "next_fetch"}} (times in epoch seconds) from the CA's
+    renewalInfo endpoint (RFC 9773). Responses cached in cache_file are reused until their Retry-After has passed.
+    For certificates from several CAs, cert_ids can map each CertID to the directory url of its CA."""
+    cache = _load_json(cache_file) if cache_file else {}
+    directories = cert_ids if isinstance(cert_ids, dict) else dict.fromkeys(cert_ids, directory_url)
+
+    stale = sorted(cert_id for cert_id in directories if cache.get(cert_id, {}).get("next_fetch", 0) <= time.time())
+    if stale:
+        endpoints = {}
+        for url in sorted(set(directories[cert_id] for cert_id in stale)):
+            try:
+                directory, _, _ = _do_request(url, err_msg="Error getting directory")
+            except ValueError as error: # one CA being down shouldn't cost the others their renewal info
+                LOGGER.warning("Cannot get renewal info from %s: %s", url, error)
                 continue
-            LOGGER.info("Setting up challenge for %s.", domain)
-
-            # find the correct challenge type and hook script
-            if challenge_type == 'http': # HTTP-01
-                challenge = [c for c in authorization['challenges'] if c['type'] == "http-01"][0]
-                token = re.sub(r"[^A-Za-z0-9_\-]", "_", challenge['token'])
-                content = "{0}.{1}".format(token, thumbprint)
-            elif challenge_type == 'dns': # DNS-01
-                challenge = [c for c in authorization['challenges'] if c['type'] == "dns-01"][0]
-                token = re.sub(r"[^A-Za-z0-9_\-]", "_", challenge['token'])
-                keyauthorization = "{0}.{1}".format(token, thumbprint)
-                content = _b64(hashlib.sha256(keyauthorization.encode('utf8')).digest())
-
-            # call hook script
-            _do_hook(hook, "setup", [domain, token, content])
-            requests += [(domain, token, content, challenge['url'], auth_url, order)]
-
-    # call hook script to activate challenge
-    _do_hook(hook, "activate", [])
-    LOGGER.info("Activated challenges.")
-
-    # check that the challenge is in place and accessible
-    if not disable_check:
-        for (domain, token, content, challenge_url, auth_url, order) in requests:
+            if "renewalInfo" in directory:
+                endpoints[url] = directory["renewalInfo"].rstrip("/")
+            else:
+                LOGGER.info("Directory %s has no renewalInfo endpoint, ARI is not supported.", url)
+
+        def _fetch(cert_id):
+            if directories[cert_id] not in endpoints:
+                return
             try:
-                LOGGER.info("checking challenge for domain %s", domain)
-                _do_hook(hook, "check", [domain, token, content])
-            except IOError:
-                LOGGER.error("Check failed for domain %s.", domain)
-                orders = [(o, oh, c) for (o, oh, c) in orders if o != order] # remove the failed order
-
-    # says the challenge is ready for checking
-    for (domain, token, content, challenge_url, auth_url, order) in requests:
-        LOGGER.info("Notifying that challenge for %s is ready.", domain)
-        _send(challenge_url, {}, "Error submitting challenges: {0}".format(domain))
-
-    # check that they challenge has been completed
-    for (domain, token, content, challenge_url, auth_url, order) in requests:
-        LOGGER.info("Verifying %s.", domain)
-        authorization = _poll_until_not(auth_url, ["pending"], "Error checking challenge status for {0}".format(domain), sender=_send)
-        if authorization['status'] != "valid":
-            LOGGER.error("Challenge did not pass for %s: %s", domain, authorization)
-            orders = [(o, oh, c) for (o, oh, c) in orders if o != order] # remove the failed order
+                info, _, headers = _do_request(endpoints[directories[cert_id]] + "/" + cert_id, err_msg="Error getting renewal info")
+                window = [_parse_time(info["suggestedWindow"]["start"]), _parse_time(info["suggestedWindow"]["end"])]
+            except (ValueError, KeyError, TypeError) as error:
+                LOGGER.warning("No renewal info for %s: %s", cert_id, error)
+                return
+            entry = cache.get(cert_id, {})
+            if entry.get("window") != window:
+                # pick a uniformly random point in the window (RFC 9773 section 4.2), once per window, so that
+                # repeated runs don't drift towards the start of it and our certificates don't renew in lockstep
+                entry = {"window": window, "renew_at": random.uniform(window[0], max(window))}
+            entry["explanation"] = info.get("explanationURL")
+            # poll again after Retry-After (default about 6 hours), clamped to between a minute and a day
+            entry["next_fetch"] = time.time() + min(86400, max(60, _poll_delay(headers, 0, base=21600, cap=21600)))
+            cache[cert_id] = entry
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            list(executor.map(_fetch, stale))
+        LOGGER.info("Fetched renewal info for %d of %d certificates.", len(stale), len(directories))
+
+    cache = {cert_id: cache[cert_id] for cert_id in directories if cert_id in cache}
+    if cache_file and stale:
+        _save_json(cache_file, cache)
+    return cache
+
+# helper function - RFC 8555 section 7.3.4 external account binding: the account key, signed with the CA's MAC key
+def _eab(jwk, url, kid, hmac_key):
+    protected64 = _b64(json.dumps({"alg": "HS256", "kid": kid, "url": url}).encode('utf8'))
+    payload64 = _b64(json.dumps(jwk).encode('utf8'))
+    key = base64.urlsafe_b64decode(hmac_key + "=" * (-len(hmac_key) % 4))
+    return {"protected": protected64, "payload": payload64, "signature": _b64(hmac.new(key, "{0}.{1}".format(protected64, payload64).encode('utf8'), hashlib.sha256).digest())}
+
+_SESSIONS, _SESSIONS_LOCKS, _SESSIONS_LOCK = {}, {}, threading.Lock()
+DIRECTORY_TTL = 86400 # seconds a persisted directory document is trusted before it is fetched again
+
+# helper function - account key, directory, nonces and account registration for one CA. Set up once per
+# (account key, directory, contact) and shared by every sign_crts call in the process, so bulk runs
+# don't repeat the directory GET and newAccount round trips for every batch of certificates.
+# With a cache_file, the directory (for DIRECTORY_TTL), the JWK and thumbprint and the account URL (keyed by
+# directory url and account key hash) also survive across runs; such a session is marked "cached" until a
+# signed request has confirmed it (see sign_crts). Passing the acct_headers of a rejected session as `rejected`
+# discards both caches and starts over, unless another thread has already done so.
+# eab is the (key id, base64url MAC key) pair a CA like ZeroSSL hands out for external account binding.
+def _get_session(account_key, directory_url, contact=None, cache_file=None, rejected=None, eab=None):
+    key = (account_key, directory_url, tuple(contact or []))
+    with _SESSIONS_LOCK:
+        lock = _SESSIONS_LOCKS.setdefault(key, threading.Lock())
+    with lock: # only callers of the same session wait for its bootstrap, not those of other accounts and CAs
+        if key in _SESSIONS and (rejected is None or _SESSIONS[key]['acct_headers'] is not rejected):
+            return _SESSIONS[key]
+        refresh = rejected is not None
+        nonce = [] # shared stack of unused nonces (see _send_signed_request)
+
+        cache = _load_json(cache_file) if cache_file else {}
+        with open(account_key, "rb") as file:
+            account_id = "{0} {1}".format(directory_url, hashlib.sha256(file.read()).hexdigest())
+        cached_directory = cache.get("directories", {}).get(directory_url)
+        cached_account = cache.get("accounts", {}).get(account_id)
+        if refresh or cached_account is None or cached_account['contact'] != contact:
+            cached_account = None
+        if refresh or cached_directory is None or cached_directory['fetched'] + DIRECTORY_TTL < time.time():
+            cached_directory = None
+
+        if cached_account is not None:
+            alg, jwk, thumbprint = cached_account['alg'], cached_account['jwk'], cached_account['thumbprint']
+        else:
+            # parse account key to get public key
+            LOGGER.info("Parsing account key.")
+            signer = _get_signer(account_key)
+            alg, jwk = signer.alg, signer.jwk
+            accountkey_json = json.dumps(jwk, sort_keys=True, separators=(',', ':'))
+            thumbprint = _b64(hashlib.sha256(accountkey_json.encode('utf8')).digest())
+
+        if cached_directory is not None:
+            directory = cached_directory['directory']
+        else:
+            # get the ACME directory of urls
+            LOGGER.info("Getting directory.")
+            directory, _, _ = _do_request(directory_url, err_msg="Error getting directory")
+            LOGGER.info("Directory found.")
+            cache.setdefault("directories", {})[directory_url] = {"directory": directory, "fetched": time.time()}
+
+        if cached_account is not None:
+            # the first signed request fetches a nonce
+            acct_headers = {"Location": cached_account['kid']}
+            LOGGER.info("Using cached account %s.", cached_account['kid'])
+        else:
+            # Obtain a nonce once up front; subsequent responses will supply the next nonce (optimization)
+            nonce.append(_do_request(directory['newNonce'])[2].get('Replay-Nonce'))
+
+            # create account, update contact details (if any), and set the global key identifier
+            LOGGER.info("Registering account.")
+            reg_payload = {"termsOfServiceAgreed": True}
+            if contact is not None:
+                reg_payload.update({"contact": contact})
+            if eab:
+                reg_payload.update({"externalAccountBinding": _eab(jwk, directory['newAccount'], *eab)})
+            elif directory.get('meta', {}).get('externalAccountRequired'):
+                raise ValueError("{0} requires external account binding (--eab-kid, --eab-hmac-key)".format(directory_url))
+            # newAccount uses acct_headers=None (triggers jwk instead of kid) + the pre-fetched nonce list
+            _take(directory_url, "newAccount")
+            account, resp_code, acct_headers = _send_signed_request(directory['newAccount'], reg_payload, "Error registering", directory, jwk, alg, None, account_key, nonce)
+            LOGGER.info("Registered." if resp_code == 201 else "Already registered.")
+            if contact is not None and resp_code != 201 and not set(contact) == set(account['contact']):
+                account, _, _ = _send_signed_request(acct_headers['Location'], {"contact": contact}, "Error updating contact details", directory, jwk, alg, acct_headers, account_key, nonce)
+                LOGGER.info("Updated contact details: %s.", "; ".join(account['contact']))
+            cache.setdefault("accounts", {})[account_id] = {"kid": acct_headers['Location'], "contact": contact, "alg": alg, "jwk": jwk, "thumbprint": thumbprint}
+
+        if cache_file and (cached_directory is None or cached_account is None):
+            with _SESSIONS_LOCK: # other sessions may have written the file meanwhile: merge, don't overwrite
+                merged = _load_json(cache_file)
+                merged.setdefault("directories", {})[directory_url] = cache["directories"][directory_url]
+                merged.setdefault("accounts", {})[account_id] = cache["accounts"][account_id]
+                _save_json(cache_file, merged)
+        session = {"directory": directory, "alg": alg, "jwk": jwk, "thumbprint": thumbprint, "acct_headers": acct_headers, "nonce": nonce,
+                   "cached": cached_directory is not None or cached_account is not None}
+        # update in place so that sign_crts calls running on other threads pick up a refreshed session too
+        with _SESSIONS_LOCK:
+            _SESSIONS.setdefault(key, {}).update(session)
+            return _SESSIONS[key]
+
+# === Journal ===
+# With a journal file, sign_crts appends a JSON line for every order it creates or resumes ("order"), every
+# challenge it sets up or removes ("setup", "remove") and every order it finalizes or is done with ("finalize",
+# "done"), tagged with the process' run id and pid. The first sign_crts call of a process, and then one every
+# JOURNAL_COMPACT seconds (in the daemon), recovers what a dead process left behind: its challenges are removed
+# through the hook that set them up, and its open orders are resumed by later calls for the same CSR and CA
+# instead of being ordered again. The journal is compacted to what's still open on each pass.
+JOURNAL_COMPACT = 3600
+_RUN, _JOURNAL_LOCK, _RESUMABLE, _RECOVERED = os.urandom(8).hex(), threading.RLock(), {}, {}
+
+def _journal_write(journal, **record):
+    with _JOURNAL_LOCK, open(journal, "a") as file:
+        file.write(json.dumps(dict(record, run=_RUN, pid=os.getpid())) + "\n")
+
+def _orphaned(record):
+    if record['run'] == _RUN:
+        return False
+    if record['pid'] == os.getpid(): # an earlier process with our pid
+        return True
+    try:
+        os.kill(record['pid'], 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+def _journal_recover(journal):
+    with _JOURNAL_LOCK:
+        if time.time() < _RECOVERED.get(journal, 0) + JOURNAL_COMPACT:
+            return
+        _RECOVERED[journal] = time.time()
+        _RESUMABLE.setdefault(journal, {})
+        # fold the journal into the orders and challenges that are still open
+        orders, challenges = {}, {}
+        try:
+            with open(journal, "r") as file:
+                lines = file.read().splitlines()
+        except OSError:
+            lines = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError: # a line cut short by a crash
+                continue
+            if record['e'] == "order":
+                orders[record['url']] = record
+            elif record['e'] == "done":
+                orders.pop(record['url'], None)
+            elif record['e'] == "setup":
+                challenges[(record['domain'], record['token'])] = record
+            elif record['e'] == "remove":
+                challenges.pop((record['domain'], record['token']), None)
+
+        hooks = set()
+        for (domain, token), record in list(challenges.items()):
+            if _orphaned(record):
+                LOGGER.info("Removing orphaned challenge for %s.", domain)
+                try:
+                    _make_hook(record['hook']).call("remove", [domain, token, record['content']])
+                except IOError as error:
+                    LOGGER.warning("Could not remove orphaned challenge for %s: %s", domain, error)
+                hooks.add(tuple(record['hook']))
+                del challenges[(domain, token)]
+        for hook in hooks:
+            _make_hook(list(hook)).call("finish", [])
+        for url, record in orders.items():
+            if _orphaned(record):
+                _RESUMABLE[journal][(record['digest'], record['directory'])] = url
+
+        # compact the journal to what's still open, unless another live process is writing to it
+        if not any(record['run'] != _RUN and not _orphaned(record) for record in list(orders.values()) + list(challenges.values())):
+            with open(journal + ".tmp", "w") as file:
+                file.writelines(json.dumps(record) + "\n" for record in list(orders.values()) + list(challenges.values()))
+            os.replace(journal + ".tmp", journal)
+
+# an open order a dead run left for this CSR (by content) and CA; claiming it makes it ours in the journal
+def _journal_resume(journal, csrfile, digest, directory_url, hook):
+    with _JOURNAL_LOCK:
+        url = _RESUMABLE.get(journal, {}).pop((digest, directory_url), None)
+        if url:
+            _journal_write(journal, e="order", url=url, csr=csrfile, digest=digest, directory=directory_url, hook=hook)
+        return url
+
+_AUTHZ, _AUTHZ_LOCK = {}, threading.Lock()
+
+# helper functions - valid authorizations seen in this process (and, with a cache file, in recent runs) by url.
+# Servers hand out an account's valid authorization for an identifier again in new orders, and one found here
+# doesn't need to be fetched to learn that.
+def _cache_authz(auth_url, authorization):
+    with _AUTHZ_LOCK:
+        if authorization is None or authorization.get('status') != 'valid' or 'expires' not in authorization:
+            _AUTHZ.pop(auth_url, None)
         else:
-            LOGGER.info("Domain %s verified.", domain)
+            _AUTHZ[auth_url] = {"domain": authorization['identifier']['value'], "expires": _parse_time(authorization['expires'])}
+
+def _cached_authz(auth_url):
+    # the domain of a cached authorization that stays valid for at least another hour, else None
+    entry = _AUTHZ.get(auth_url)
+    return entry['domain'] if entry and entry['expires'] > time.time() + 3600 else None
+
+def _load_authz(cache_file):
+    with _AUTHZ_LOCK:
+        for auth_url, entry in _load_json(cache_file).items():
+            _AUTHZ.setdefault(auth_url, entry)
+
+def _save_authz(cache_file):
+    with _AUTHZ_LOCK:
+        _save_json(cache_file, {auth_url: entry for auth_url, entry in _AUTHZ.items() if entry['expires'] > time.time()})
+
+# helper function - the identifiers (CN and DNS SANs) a CSR asks for
+def _csr_domains(csrfile):
+    try:
+        info = _load_x509(csrfile)
+    except (IOError, ValueError) as error:
+        raise IOError("Error loading {0}\n{1}".format(csrfile, error))
+    return set(info["sans"] + ([info["cn"]] if info["cn"] else []))
+
+# helper function - group CSRs by identifier set; returns {csrfile: domains} and the waves of CSRs to order
+# (the n-th wave holds the n-th CSR of every group)
+def _plan_orders(csr):
+    plan, groups = {}, {}
+    for csrfile in csr:
+        LOGGER.info("Parsing CSR %s.", csrfile)
+        plan[csrfile] = _csr_domains(csrfile)
+        groups.setdefault(frozenset(plan[csrfile]), []).append(csrfile)
+    waves = [[group[i] for group in groups.values() if i < len(group)] for i in range(max(map(len, groups.values()), default=0))]
+    return plan, waves
 
-        # remove challenge
-        LOGGER.info("removing challenge for domain %s", domain)
-        _do_hook(hook, "remove", [domain, token, content])
+def deploy_crts(hook, csrfiles):
+    """Call the hook's deploy command once for all the certificates it has just written, e.g. to reload a server."""
+    if csrfiles:
+        LOGGER.info("Deploying %d certificate(s).", len(csrfiles))
+        _make_hook(hook).call("deploy", list(csrfiles))
 
-    # finish the cleanup
-    _do_hook(hook, "finish", [])
+def sign_crts(account_key, csr, disable_check=False, directory_url=DEFAULT_DIRECTORY_URL, contact=None, hook=None, challenge_type=None, profile=None, replaces=None, concurrency=DEFAULT_CONCURRENCY, hook_mode="single", dns_resolvers=None, dns_quorum=None, session_cache=None, authz_cache=None, dry_run=False, journal=None, rate_limits=None, deploy=False, eab=None, trace=None):
+    """Issue certificates for the given CSR files; returns the (csrfile, certificate_pem) pairs that were written."""
+    crts, failed, started = [], [], time.time()
+    pool_stats = dict(_POOL.stats)
+    if isinstance(replaces, str):
+        replaces = {csrfile: replaces for csrfile in csr}
 
-    # finalize each order where all challenges passed
-    finalize_urls = [] 
+    # Plan the orders: CSRs for the same set of identifiers (e.g. the RSA and ECDSA key of one certificate) are
+    # ordered in successive waves, so only the first one sets up challenges and the others find their
+    # authorizations valid. A follower isn't ordered at all once its leader failed.
+    plan, waves = _plan_orders(csr)
+    if dry_run:
+        for i, wave in enumerate(waves):
+            for csrfile in wave:
+                print("wave {0}\t{1}\t{2}".format(i, csrfile, ",".join(plan[csrfile])))
+        return []
 
-    for (order, order_headers, csrfile) in orders:
-        LOGGER.info("Signing certificate for CSR %s.", csrfile)
-        csr_der = _cmd(["openssl", "req", "-in", csrfile, "-outform", "DER"], err_msg="DER Export Error")
+    hooks = _make_hook(hook, hook_mode)
+    if authz_cache:
+        _load_authz(authz_cache)
+    if journal:
+        _journal_recover(journal)
+    if rate_limits:
+        _load_limits(rate_limits)
+    if trace:
+        _trace_open(trace)
+
+    # journal a step, and keep track of the challenges set up and the orders opened by this call (see finally below)
+    live, opened = {}, {}
+    def _record(**record):
+        if record['e'] == "setup":
+            live[(record['domain'], record['token'])] = record['content']
+        elif record['e'] == "remove":
+            live.pop((record['domain'], record['token']), None)
+        elif record['e'] == "order":
+            opened[record['url']] = record['digest']
+        elif record['e'] == "done":
+            opened.pop(record['url'], None)
+        if journal:
+            _journal_write(journal, **record)
+
+    with _span("session", directory=directory_url):
+        session = _get_session(account_key, directory_url, contact, session_cache, eab=eab)
+    thumbprint = session['thumbprint']
+
+    # Local short-form sender (closes over session/account_key).
+    # All post-account signed requests (newOrder, auths, challenges, finalize, downloads) use this.
+    def _send(url, payload, err_msg):
+        return _send_signed_request(url, payload, err_msg, session['directory'], session['jwk'], session['alg'], session['acct_headers'], account_key, session['nonce'])
+
+    # newOrder is the first request signed with the account url. If a session restored from session_cache fails
+    # there because the account is unknown or deactivated, or the newOrder url is gone (directory moved), refresh
+    # it once and try again. Other errors (a rejected `replaces`, rate limits, server errors) are the order's.
+    def _new_order(payload):
+        acct_headers = session['acct_headers']
+        _take(directory_url, "newOrder", account_key=account_key)
+        try:
+            result = _send(session['directory']['newOrder'], payload, "Error creating new order")
+        except ValueError as error:
+            rejected = getattr(error, "problem", None) in ["urn:ietf:params:acme:error:accountDoesNotExist", "urn:ietf:params:acme:error:unauthorized"] or getattr(error, "status", None) == 404
+            if not session['cached'] or not rejected:
+                raise
+            LOGGER.info("Cached session was rejected, refreshing: %s", error)
+            _get_session(account_key, directory_url, contact, session_cache, rejected=acct_headers, eab=eab)
+            result = _send(session['directory']['newOrder'], payload, "Error creating new order")
+        session['cached'] = False
+        return result
+
+    # fetch an authorization and set up its challenge; runs on the worker pool
+    def _setup_challenge(auth_url, order):
+        cached = _cached_authz(auth_url)
+        if cached:
+            LOGGER.info("Domain %s already verified (cached). Skipping.", cached)
+            return None
+        authorization, _, _ = _send(auth_url, None, "Error getting challenges")
+        domain = authorization['identifier']['value']
+        if authorization['status'] == 'valid':
+            LOGGER.info("Domain %s already verified. Skipping.", domain)
+            _cache_authz(auth_url, authorization)
+            return None
+        LOGGER.info("Setting up challenge for %s.", domain)
+
+        # find the correct challenge type and hook script
+        if challenge_type == 'http': # HTTP-01
+            challenge = [c for c in authorization['challenges'] if c['type'] == "http-01"][0]
+            token = re.sub(r"[^A-Za-z0-9_\-]", "_", challenge['token'])
+            content = "{0}.{1}".format(token, thumbprint)
+        elif challenge_type == 'dns': # DNS-01
+            challenge = [c for c in authorization['challenges'] if c['type'] == "dns-01"][0]
+            token = re.sub(r"[^A-Za-z0-9_\-]", "_", challenge['token'])
+            keyauthorization = "{0}.{1}".format(token, thumbprint)
+            content = _b64(hashlib.sha256(keyauthorization.encode('utf8')).digest())
+
+        # call hook script (batch hooks get all setups at once below)
+        _record(e="setup", domain=domain, token=token, content=content, hook=hook)
+        if not hooks.batched:
+            hooks.call("setup", [domain, token, content])
+        return (domain, token, content, challenge['url'], auth_url, order)
+
+    try:
+        for i, wave in enumerate(waves):
+            issued = [frozenset(plan[c]) for (c, _, _) in crts]
+            wave = [csrfile for csrfile in wave if i == 0 or frozenset(plan[csrfile]) in issued]
+            requests, orders, phase = [], [], time.time()
 
-        # Only finalize each order once (multiple CSRs can be signed by the same order)
-        if order['finalize'] not in finalize_urls:
-            _send(order['finalize'], {"csr": _b64(csr_der)}, "Error finalizing order")
-            finalize_urls.append(order['finalize'])
+            # Orders are created one after another, but their authorizations are handed to a bounded pool as soon as
+            # each order exists, so round trips and hook executions overlap instead of running strictly in series.
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                challenges = []
 
-        # poll the order to monitor when it's done
-        order = _poll_until_not(order_headers['Location'], ["pending", "processing"], "Error checking order status", sender=_send)
-        if order['status'] != "valid":
-            raise ValueError("Order failed: {0}".format(order))
+                for csrfile in wave:
+                    domains = plan[csrfile]
+                    LOGGER.info("Found domains for %s: %s.", csrfile, ", ".join(domains))
+                    exhausted = [d for d in domains if rate_budget(directory_url, "failedValidation", d, account_key=account_key) < 1]
+                    if exhausted:
+                        LOGGER.error("Too many failed validations for %s recently, deferring %s.", ", ".join(exhausted), csrfile)
+                        continue
 
-        # download the certificate
-        certificate_pem, _, _ = _send(order['certificate'], None, "Certificate download failed")
-        LOGGER.info("Certificate signed for %s.", csrfile)
-        crts += [(csrfile, certificate_pem)]
+                    # resume the order a killed run left for this CSR, as long as it can still be completed
+                    digest = hashlib.sha256(_load_x509(csrfile)["der"]).hexdigest()
+                    order, resumed = None, _journal_resume(journal, csrfile, digest, directory_url, hook) if journal else None
+                    if resumed:
+                        try:
+                            order, _, _ = _send(resumed, None, "Error resuming order")
+                        except ValueError as error:
+                            LOGGER.info("Cannot resume order %s: %s", resumed, error)
+                        if order is not None and order['status'] in ["pending", "ready", "processing", "valid"]:
+                            LOGGER.info("Resuming %s order %s.", order['status'], resumed)
+                            order_headers = {"Location": resumed}
+                            opened[resumed] = digest # claimed in the journal by _journal_resume
+                        else:
+                            _record(e="done", url=resumed)
+                            order = None
 
-    # output result via the hook scripts
-    for (csr, crt) in crts:
-        _do_hook(hook, 'write', [csr], stdin=subprocess.PIPE, cmd_input=crt.encode('utf8'), echo=True)
+                    # create a new order
+                    if order is None:
+                        LOGGER.info("Creating new order.")
+                        order_payload = {"identifiers": [{"type": "dns", "value": d} for d in domains]}
+                        if profile:
+                            order_payload["profile"] = profile
+                            LOGGER.info("Requesting profile: %s", profile)
+                        if replaces and replaces.get(csrfile):
+                            order_payload["replaces"] = replaces[csrfile]
+                            LOGGER.info("Requesting replacement of CertID: %s", replaces[csrfile])
+
+                        order, _, order_headers = _new_order(order_payload)
+                        LOGGER.info("Order created. Server selected profile: %s", order['profile']) if 'profile' in order else LOGGER.info("Order created.")
+                        _record(e="order", url=order_headers['Location'], csr=csrfile, digest=digest, directory=directory_url, hook=hook)
+                    orders += [(order, order_headers, csrfile)]
+
+                    # get the authorizations that need to be completed
+                    challenges += [executor.submit(_setup_challenge, auth_url, order) for auth_url in order['authorizations']]
+
+                requests = [r for r in (c.result() for c in challenges) if r is not None]
+
+            if hooks.batched:
+                for error in hooks.call_many("setup", [[d, t, c] for (d, t, c, _, _, _) in requests]):
+                    if error is not None:
+                        raise error
+
+            # call hook script to activate challenge (nothing to do if every authorization was already valid)
+            if requests:
+                hooks.call("activate", [])
+                LOGGER.info("Activated challenges.")
+            _record_span("orders", time.time() - phase, wave=i, orders=len(orders), challenges=len(requests))
+            phase = time.time()
+
+            # check that the challenge is in place and accessible
+            if not disable_check and requests:
+                LOGGER.info("checking challenges for domains %s", ", ".join(r[0] for r in requests))
+                if challenge_type == 'dns' and dns_resolvers: # built-in propagation check instead of the hook's
+                    errors = _check_dns_propagation([(d, c) for (d, t, c, _, _, _) in requests], dns_resolvers, dns_quorum, concurrency)
+                else:
+                    errors = hooks.call_many("check", [[d, t, c] for (d, t, c, _, _, _) in requests])
+                for (domain, token, content, challenge_url, auth_url, order), error in zip(requests, errors):
+                    if error is not None:
+                        LOGGER.error("Check failed for domain %s.", domain)
+                        for (o, oh, c) in orders:
+                            if o is order:
+                                _record(e="done", url=oh['Location'])
+                        orders = [(o, oh, c) for (o, oh, c) in orders if o != order] # remove the failed order
+                _record_span("check", time.time() - phase, wave=i, challenges=len(requests))
+                phase = time.time()
+
+            # says the challenge is ready for checking
+            for (domain, token, content, challenge_url, auth_url, order) in requests:
+                LOGGER.info("Notifying that challenge for %s is ready.", domain)
+                _send(challenge_url, {}, "Error submitting challenges: {0}".format(domain))
+
+            # finalize an order whose challenges all passed and start polling it
+            finalize_urls = []
+            def _finalize(order, order_headers, csrfile):
+                LOGGER.info("Signing certificate for CSR %s.", csrfile)
+                csr_der = _load_x509(csrfile)["der"]
+
+                # Only finalize each order once (multiple CSRs can be signed by the same order), and not at all if
+                # it already was (a resumed order, or a valid one the server handed out again)
+                if order['finalize'] not in finalize_urls and order['status'] in ["pending", "ready"]:
+                    _send(order['finalize'], {"csr": _b64(csr_der)}, "Error finalizing order")
+                    finalize_urls.append(order['finalize'])
+                    _record(e="finalize", url=order_headers['Location'])
+
+                # poll the order to monitor when it's done
+                poller.add(("order", (csrfile, order_headers['Location'])), order_headers['Location'], ["pending", "processing"], "Error checking order status")
+
+            # Poll all authorizations at once and act on each as it completes: its challenge is removed right away
+            # and an order is finalized as soon as its last authorization is valid, while the others are still pending.
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                poller, outstanding, removals = _Poller(_send, executor), {}, []
+                for (domain, token, content, challenge_url, auth_url, order) in requests:
+                    LOGGER.info("Verifying %s.", domain)
+                    outstanding[id(order)] = outstanding.get(id(order), 0) + 1
+                    poller.add(("authz", (domain, token, content, order, auth_url)), auth_url, ["pending"], "Error checking challenge status for {0}".format(domain))
+                remaining = len(requests)
+                for (order, order_headers, csrfile) in orders:
+                    if not outstanding.get(id(order)):
+                        _finalize(order, order_headers, csrfile)
+
+                for (kind, item), result in poller:
+                    if kind == "order":
+                        # download the certificate
+                        csrfile, order_url = item
+                        if result['status'] != "valid":
+                            LOGGER.error("Order failed for %s: %s", csrfile, result)
+                            failed += [result]
+                            _record(e="done", url=order_url)
+                            for auth_url in result.get('authorizations', []):
+                                _cache_authz(auth_url, None) # don't trust this order's authorizations next time
+                            continue
+                        certificate_pem, _, _ = _send(result['certificate'], None, "Certificate download failed")
+                        LOGGER.info("Certificate signed for %s.", csrfile)
+                        crts += [(csrfile, certificate_pem, order_url)]
+                        continue
+
+                    # check that the challenge has been completed
+                    domain, token, content, order, auth_url = item
+                    if result['status'] != "valid":
+                        LOGGER.error("Challenge did not pass for %s: %s", domain, result)
+                        _take(directory_url, "failedValidation", domain, wait=False, account_key=account_key)
+                        for (o, oh, c) in orders:
+                            if o is order:
+                                _record(e="done", url=oh['Location'])
+                        orders = [(o, oh, c) for (o, oh, c) in orders if o != order] # remove the failed order
+                    else:
+                        LOGGER.info("Domain %s verified.", domain)
+                        _cache_authz(auth_url, result)
+
+                    # remove challenge (batch hooks get all removals at once when the last one is done)
+                    LOGGER.info("removing challenge for domain %s", domain)
+                    if hooks.batched:
+                        removals += [[domain, token, content]]
+                    else:
+                        hooks.call("remove", [domain, token, content])
+                        _record(e="remove", domain=domain, token=token)
+                    remaining -= 1
+                    if not remaining:
+                        for (domain, token, content), error in zip(removals, hooks.call_many("remove", removals)):
+                            if error is not None:
+                                raise error
+                            _record(e="remove", domain=domain, token=token)
+                        hooks.call("finish", []) # finish the cleanup
+
+                    # finalize the order once all of its challenges passed
+                    outstanding[id(order)] -= 1
+                    if not outstanding[id(order)]:
+                        for (o, oh, c) in orders:
+                            if o is order:
+                                _finalize(o, oh, c)
+            _record_span("validate", time.time() - phase, wave=i, challenges=len(requests))
+
+        if authz_cache:
+            _save_authz(authz_cache)
+
+        # output result via the hook scripts, all at once after every order is done. A certificate the hook failed to
+        # write doesn't keep the others from being written and deployed.
+        crts.sort(key=lambda crt: csr.index(crt[0]))
+        written, phase = [], time.time()
+        for (csrfile, crt, order_url) in crts:
+            try:
+                hooks.call('write', [csrfile], stdin=subprocess.PIPE, cmd_input=crt.encode('utf8'), echo=True)
+            except IOError as error:
+                LOGGER.error("Writing the certificate for %s failed: %s", csrfile, error)
+                failed += [error]
+                continue
+            _record(e="done", url=order_url)
+            written += [csrfile]
+        crts = [(csrfile, crt, order_url) for (csrfile, crt, order_url) in crts if csrfile in written]
+    finally:
+        # A call that raised (a failed setup, a poll error, a deferred request) removes the challenges it set up
+        # right away instead of leaving them to the next process' journal recovery, and later calls of this
+        # process resume the orders it left open.
+        if live:
+            leftover = list(live.items())
+            LOGGER.info("Removing %d challenge(s) that were set up.", len(leftover))
+            for ((domain, token), content), error in zip(leftover, hooks.call_many("remove", [[d, t, c] for ((d, t), c) in leftover])):
+                if error is not None:
+                    LOGGER.warning("Could not remove challenge for %s: %s", domain, error)
+                    continue
+                _record(e="remove", domain=domain, token=token)
+            try:
+                hooks.call("finish", [])
+            except IOError as error:
+                LOGGER.warning("Finishing the cleanup failed: %s", error)
+        if journal and opened:
+            with _JOURNAL_LOCK:
+                for url, digest in opened.items():
+                    _RESUMABLE.setdefault(journal, {})[(digest, directory_url)] = url
+        hooks.close()
+    _record_span("write", time.time() - phase, certificates=len(written))
+    if deploy and written:
+        with _span("deploy", certificates=len(written)):
+            deploy_crts(hook, written)
+
+    LOGGER.info("HTTP: %s", _POOL.summary(since=pool_stats))
+    _record_span("sign_crts", time.time() - started, csrs=len(csr), issued=len(crts))
+    # orders dropped because a challenge failed count as failures too
+    missing = [c for c in csr if c not in [issued for (issued, _, _) in crts]]
+    if missing:
+        failure = ValueError("Order failed for {0}: {1}".format(", ".join(missing), failed[0] if len(failed) == 1 else failed or "challenge failed"))
+        failure.missing, failure.written = missing, [(csrfile, crt) for (csrfile, crt, _) in crts]
+        raise failure
+    return [(csrfile, crt) for (csrfile, crt, _) in crts]
 
 def main(argv=None):
     parser = argparse.ArgumentParser(
@@ -300,6 +1540,19 @@ def main(argv=None):
     sign_parser.add_argument("--csr", required=True, action="append", help="path to your certificate signing request, can be given multiple times")
     sign_parser.add_argument("--profile", help="ACME profile name (see 'profiles' command). Optional; server chooses default if omitted.")
     sign_parser.add_argument("--replaces", help="RFC 9773 CertID of certificate to replace (for renewal). Optional; if omitted, a new certificate will be issued instead of renewing an existing one.")
+    sign_parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="max. number of authorizations fetched and set up at the same time, default is {0}".format(DEFAULT_CONCURRENCY))
+    sign_parser.add_argument("--hook-mode", choices=list(_HOOK_MODES), default="single", help="hook protocol: one process per call (single, default), one process per stage (batch) or one process per run (serve); batch and serve need hook support")
+    sign_parser.add_argument("--dns-resolver", metavar="URL", action="append", help="check DNS-01 records on this resolver instead of calling the hook's check: a DoH JSON url (https://1.1.1.1/dns-query) or dns://host[:port]; can be given multiple times")
+    sign_parser.add_argument("--authz-cache", metavar="FILE", help="remember valid authorizations in this file so that later runs don't need to fetch them again")
+    sign_parser.add_argument("--journal", metavar="FILE", help="record orders and challenges in this file, so that a run that was killed can be resumed and cleaned up by the next one")
+    sign_parser.add_argument("--trace", metavar="FILE", help="append timings of requests, signatures, subprocesses, hook calls and polls, and retry counters, to this file as JSON lines")
+    sign_parser.add_argument("--deploy", action="store_true", help="call the hook's deploy command once after all certificates are written (e.g. to reload the web server)")
+    sign_parser.add_argument("--dry-run", action="store_true", help="print which CSRs would be ordered in which wave, then exit without contacting the CA")
+    sign_parser.add_argument("--session-cache", metavar="FILE", help="keep the directory and account url in this file so that later runs can skip the directory and newAccount requests")
+    sign_parser.add_argument("--rate-limits", metavar="FILE", help="keep the request budgets and the urls the CA asked to back off from in this file, so that later runs respect them too")
+    sign_parser.add_argument("--eab-kid", help="key id for external account binding, for CAs that require it to register an account (e.g. ZeroSSL)")
+    sign_parser.add_argument("--eab-hmac-key", help="base64url MAC key for external account binding")
+    sign_parser.add_argument("--dns-quorum", type=int, default=None, help="number of resolvers that must see a record before it counts as propagated, default is a majority")
     hookgroup = sign_parser.add_mutually_exclusive_group(required=True)
     hookgroup.add_argument("--dns-hook", help="the hook script to call for DNS-01 type challenges")
     hookgroup.add_argument("--http-hook", help="the hook script to call for HTTP-01 type challenges")
@@ -314,8 +1567,9 @@ def main(argv=None):
     # === Placeholders for future features (keep minimal to preserve auditability) ===
     subparsers.add_parser("revoke", help="Revoke certificate (ACME revokeCert; placeholder - not implemented)")
     subparsers.add_parser("keychange", help="Account key rollover (ACME keyChange; placeholder - not implemented)")
-    ari_parser = subparsers.add_parser("ari", help="Query ARI renewal window (RFC 9773; relies on certid)")
-    ari_parser.add_argument("certificate", help="path to PEM certificate (computes CertID internally)")
+    # === ARI ===
+    ari_parser = subparsers.add_parser("ari", help="Query ARI renewal window (RFC 9773)")
+    ari_parser.add_argument("certificate", nargs="+", help="path to PEM certificate (computes CertID internally), can be given multiple times")
 
     args = parser.parse_args(argv)
 
@@ -337,17 +1591,34 @@ def main(argv=None):
             hook=hook,
             challenge_type=challenge_type,
             profile=args.profile,
-            replaces=args.replaces
+            replaces=args.replaces,
+            concurrency=args.concurrency,
+            hook_mode=args.hook_mode,
+            dns_resolvers=args.dns_resolver,
+            dns_quorum=args.dns_quorum,
+            session_cache=args.session_cache,
+            authz_cache=args.authz_cache,
+            dry_run=args.dry_run,
+            journal=args.journal,
+            rate_limits=args.rate_limits,
+            deploy=args.deploy,
+            eab=(args.eab_kid, args.eab_hmac_key) if args.eab_kid else None,
+            trace=args.trace
         )
     elif args.command == "revoke":
         raise NotImplementedError("revoke not implemented (placeholder per plan; see TODO.md and RFC 8555 §7.6)")
     elif args.command == "keychange":
         raise NotImplementedError("keychange not implemented (placeholder per plan; see TODO.md and RFC 8555 §7.3.5)")
     elif args.command == "ari":
-        # Demonstrate reliance on get_cert_id + surface a usable CertID immediately.
-        cid = get_cert_id(args.certificate)
-        print(f"CertID: {cid}")
-        raise NotImplementedError("ari query not implemented (placeholder; directory['renewalInfo'] + GET will be added later)")
+        cert_ids = {certificate: get_cert_id(certificate) for certificate in args.certificate}
+        info = renewal_info(list(cert_ids.values()), args.directory_url)
+        for certificate, cert_id in cert_ids.items():
+            if cert_id not in info:
+                print(f"{certificate}\t{cert_id}\tno renewal info")
+                continue
+            start, end = [time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t)) for t in info[cert_id]["window"]]
+            renew_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(info[cert_id]["renew_at"]))
+            print(f"{certificate}\t{cert_id}\twindow {start} - {end}\trenew at {renew_at}" + (f"\t{info[cert_id]['explanation']}" if info[cert_id]["explanation"] else ""))
 
 if __name__ == "__main__": # pragma: no cover
     main(sys.argv[1:])
\ No newline at end of file
@@ -1,4 +1,6 @@
-import os, subprocess, sys, logging, argparse, configparser
+import os, subprocess, sys, logging, argparse, configparser, json, hashlib, time, heapq, signal, socket, socketserver, threading, math
+from concurrent.futures import ThreadPoolExecutor
+import acme_hooked
 
 LOGGER = logging.getLogger(__name__)
 
@@ -11,38 +13,103 @@ config.read('acmectl.conf')
 options = config['general']
 endpoints = config['endpoints']
 BASEDIR = options['WORKDIR'] if options["WORKDIR"] else os.getcwd()
+CONCURRENCY = options.getint('CONCURRENCY', fallback=8)
+WORKERS = options.getint('WORKERS', fallback=4)
+RENEW_THRESHOLD = options.getint('RENEW_THRESHOLD', fallback=30)
+INVENTORY = os.path.join(BASEDIR, 'state', 'inventory.json')
+RENEWAL_INFO = os.path.join(BASEDIR, 'state', 'renewal-info.json')
+SESSION_CACHE = os.path.join(BASEDIR, 'state', 'session.json')
+AUTHZ_CACHE = os.path.join(BASEDIR, 'state', 'authz.json')
+JOURNAL = os.path.join(BASEDIR, 'state', 'journal.jsonl')
+RATE_LIMITS = os.path.join(BASEDIR, 'state', 'ratelimits.json')
+TRACE = os.path.join(BASEDIR, 'state', 'trace.jsonl')
+METRICS = os.path.join(BASEDIR, 'state', 'acmectl.prom')
+SHARD_STATE = os.path.join(BASEDIR, 'state', 'shards.json')
+# a shard that fails this many times in a row for reasons that are the CA's is skipped for SHARD_COOLDOWN seconds
+SHARD_FAILURES = options.getint('SHARD_FAILURES', fallback=3)
+SHARD_COOLDOWN = options.getint('SHARD_COOLDOWN', fallback=3600)
+KEYPOOL = os.path.join(BASEDIR, 'state', 'keypool')
+DAEMON_SOCKET = os.path.join(BASEDIR, 'state', 'acmectl.sock')
+# how often the daemon looks for changed files, and how long it waits before retrying a failed renewal (doubling up to a day)
+DAEMON_POLL = options.getint('DAEMON_POLL', fallback=60)
+DAEMON_RETRY = options.getint('DAEMON_RETRY', fallback=900)
+HOOK_MODE = options.get('HOOK_MODE', 'single')
+# built-in DNS-01 propagation check (replaces the hook's `check` when resolvers are configured)
+DNS_RESOLVERS = options.get('DNS_RESOLVERS', '').split()
+DNS_QUORUM = int(options.get('DNS_QUORUM') or 0) or None
+DNS_CHECK = "".join(f" --dns-resolver {resolver}" for resolver in DNS_RESOLVERS) + (f" --dns-quorum {DNS_QUORUM}" if DNS_RESOLVERS and DNS_QUORUM else "")
 
 def die(message):
     LOGGER.error(message)
     exit(1)
 
+def write_key(path, key_type, curve=options["CURVE"], pooled=True):
+    # write a new private key (mode 0600), preferably one that `genall --pool` generated ahead of time. Raises
+    # IOError if openssl fails (this runs on genall's thread pool, and in the daemon: only main() may die())
+    pool = os.path.join(KEYPOOL, 'rsa' if key_type == 'rsa' else f'ecdsa-{curve}')
+    for key in sorted(os.listdir(pool)) if pooled and os.path.isdir(pool) else []:
+        try:
+            os.rename(os.path.join(pool, key), path)
+            return
+        except OSError: # another run took it
+            continue
+
+    if key_type == 'rsa':
+        key = subprocess.run(['openssl', 'genrsa', '4096'], capture_output=True)
+    else:
+        ecparam = subprocess.run(['openssl', 'ecparam', '-genkey', '-name', curve], capture_output=True)
+        key = subprocess.run(['openssl', 'ec'], input=ecparam.stdout, capture_output=True) if ecparam.returncode == 0 else ecparam
+    if key.returncode != 0:
+        raise IOError(f"Cannot generate {key_type} key {path}: {key.stderr.decode()}")
+    with open(os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as file:
+        file.write(key.stdout)
+    os.replace(path + '.tmp', path)
+
 def genkey(mode="both", name="", curve=options["CURVE"]):
     if mode == "rsa" or mode == "both":
-        subprocess.run(['openssl', 'genrsa', '4096'], stdout=open(os.path.join(BASEDIR, 'certs', f'{name}.rsa.key'), 'w'))
+        write_key(os.path.join(BASEDIR, 'certs', f'{name}.rsa.key'), 'rsa')
 
     if mode == "ecdsa" or mode == "both":
-        ecparam = subprocess.run(['openssl', 'ecparam', '-genkey', '-name', curve], capture_output=True)
-        if ecparam.returncode == 0:
-            eckey = subprocess.run(['openssl', 'ec', '-out', os.path.join(BASEDIR, 'certs', f'{name}.ecdsa.key')], input=ecparam.stdout, capture_output=True)
-            if eckey.returncode == 0:
-                LOGGER.info(eckey.stdout.decode())
-            else:
-                LOGGER.info(eckey.stderr.decode())
-        else:
-            LOGGER.info(ecparam.stderr.decode())
+        write_key(os.path.join(BASEDIR, 'certs', f'{name}.ecdsa.key'), 'ecdsa', curve)
 
-def gencsr(name):
+def gencsr(name, key_types=('rsa', 'ecdsa')):
     if not os.path.isfile(os.path.join(BASEDIR, 'certs', f'{name}.san')):
         die(f"Cannot read SAN file {name}.san")
 
     with open(os.path.join(BASEDIR, 'certs', f'{name}.san'), 'r') as file:
-        SANEXT = 'subjectAltName = ' + ','.join(['DNS:' + line.strip() for line in file])
+        SANEXT = 'subjectAltName = ' + ','.join(['DNS:' + line.strip() for line in file if line.strip()])
 
-    if os.path.isfile(os.path.join(BASEDIR, 'certs', f'{name}.rsa.key')):
-        subprocess.run(['openssl', 'req', '-new', '-sha256', '-key', os.path.join(BASEDIR, 'certs', f'{name}.rsa.key'), '-subj', '/', '-addext', SANEXT], stdout=open(os.path.join(BASEDIR, 'certs', f'{name}.rsa.csr'), 'w'))
+    for key_type in key_types:
+        key, csr = [os.path.join(BASEDIR, 'certs', f'{name}.{key_type}.{ext}') for ext in ('key', 'csr')]
+        if os.path.isfile(key):
+            subprocess.run(['openssl', 'req', '-new', '-sha256', '-key', key, '-subj', '/', '-addext', SANEXT, '-out', csr + '.tmp'], check=True)
+            os.replace(csr + '.tmp', csr)
 
-    if os.path.isfile(os.path.join(BASEDIR, 'certs', f'{name}.ecdsa.key')):
-        subprocess.run(['openssl', 'req', '-new', '-sha256', '-key', os.path.join(BASEDIR, 'certs', f'{name}.ecdsa.key'), '-subj', '/', '-addext', SANEXT], stdout=open(os.path.join(BASEDIR, 'certs', f'{name}.ecdsa.csr'), 'w'))
+def genall(mode="both", curve=options["CURVE"], pool_size=0):
+    # (re)generate what is stale for every certs/<name>.san: missing keys, and CSRs that are missing or older than
+    # their .san or key. openssl runs in parallel, one process per CPU. Afterwards, top up the key pool in
+    # state/keypool/ to pool_size keys of each type so that new names get their keys instantly.
+    key_types = ['rsa', 'ecdsa'] if mode == "both" else [mode]
+    names = sorted(file.removesuffix('.san') for file in os.listdir(os.path.join(BASEDIR, 'certs')) if file.endswith('.san'))
+    path = lambda name, key_type, ext: os.path.join(BASEDIR, 'certs', f'{name}.{key_type}.{ext}')
+    mtime = lambda file: os.stat(file).st_mtime_ns if os.path.isfile(file) else 0
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        keys = [(name, key_type) for name in names for key_type in key_types if not os.path.isfile(path(name, key_type, 'key'))]
+        list(executor.map(lambda job: write_key(path(*job, 'key'), job[1], curve), keys))
+
+        csrs = [(name, key_type) for name in names for key_type in key_types
+                if mtime(path(name, key_type, 'csr')) <= max(mtime(os.path.join(BASEDIR, 'certs', f'{name}.san')), mtime(path(name, key_type, 'key')))]
+        list(executor.map(lambda job: gencsr(job[0], [job[1]]), csrs))
+
+        pooled = []
+        for key_type in key_types if pool_size else []:
+            pool = os.path.join(KEYPOOL, 'rsa' if key_type == 'rsa' else f'ecdsa-{curve}')
+            os.makedirs(pool, exist_ok=True)
+            pooled += [(os.path.join(pool, f'{time.time_ns()}-{i}.key'), key_type) for i in range(pool_size - len(os.listdir(pool)))]
+        list(executor.map(lambda job: write_key(job[0], job[1], curve, pooled=False), pooled))
+
+    LOGGER.info(f"{len(names)} names: generated {len(keys)} keys, {len(csrs)} CSRs and {len(pooled)} pooled keys.")
 
 def getone(name, use_hook, endpoint, quiet=False):
     csrs = ""
@@ -52,36 +119,546 @@ def getone(name, use_hook, endpoint, quiet=False):
         csrs += f"--csr {os.path.join(BASEDIR, 'certs', f'{name}.ecdsa.csr')} "
 
     q = "-q " if quiet else ""
+    dns_check = DNS_CHECK if use_hook.startswith("--dns") else ""
     # subprocess.run() needs each argument to be a separate list element; some of my parameters are already pre-prepared arguments and will break the subprocess.run() call
-    cmdline = f"python3 acme_hooked.py {q}--account-key {options['LE_ACCOUNT_KEY']} {use_hook} {csrs}--directory-url {endpoint}"
+    cmdline = f"python3 acme_hooked.py {q}sign --account-key {options['LE_ACCOUNT_KEY']} {use_hook} {csrs}--directory-url {endpoint} --concurrency {CONCURRENCY} --hook-mode {HOOK_MODE} --session-cache {SESSION_CACHE} --authz-cache {AUTHZ_CACHE} --journal {JOURNAL} --rate-limits {RATE_LIMITS} --trace {TRACE} --deploy{dns_check}"
     subprocess.run(cmdline.split(' '))
 
 def quickstart(name, use_hook, endpoint):
     # If there is no account key, generate one
     if not os.path.isfile(os.path.join(BASEDIR, options["LE_ACCOUNT_KEY"])):
-        subprocess.run(['openssl', 'genrsa', '4096'], stdout=open(os.path.join(BASEDIR, options["LE_ACCOUNT_KEY"]), 'w'))
+        write_key(os.path.join(BASEDIR, options["LE_ACCOUNT_KEY"]), 'rsa')
 
-    # if there is no dhparam file, generate one
+    # if there is no dhparam file, write the RFC 7919 ffdhe4096 group (instant, unlike generating 4096-bit parameters)
     if not os.path.isfile(os.path.join(BASEDIR, 'certs', 'dhparam.pem')):
-        subprocess.run(['openssl', 'dhparam', '4096'], stdout=open(os.path.join(BASEDIR, 'certs', 'dhparam.pem'), 'w'))
+        subprocess.run(['openssl', 'genpkey', '-genparam', '-algorithm', 'DH', '-pkeyopt', 'group:ffdhe4096', '-out', os.path.join(BASEDIR, 'certs', 'dhparam.pem')])
 
     genkey("both", name)
     gencsr(name)
     getone(name, use_hook, endpoint, quiet=False)  # quickstart is interactive; quiet handled by caller if needed
 
-def unattended(endpoint, quiet=False):
-    # traverse BASEDIR/by-hook/dns and build a list of csrs that will be called with the default dns hook
-    use_with_dns_hook = " ".join([f"--csr {os.path.join(root, file)}" for root, dirs, files in os.walk(os.path.join(BASEDIR, 'by-hook', 'dns')) for file in files if file.endswith('.csr')])
-    # traverse BASEDIR/by-hook/http and build a list of csrs that will be called with the default dns hook
-    use_with_http_hook = " ".join([f"--csr {os.path.join(root, file)}" for root, dirs, files in os.walk(os.path.join(BASEDIR, 'by-hook', 'http')) for file in files if file.endswith('.csr')])
+def find_csrs(hook_type):
+    # traverse BASEDIR/by-hook/<hook_type> and group the csrs by certificate name (<name>.rsa.csr + <name>.ecdsa.csr)
+    groups = {}
+    for root, dirs, files in os.walk(os.path.join(BASEDIR, 'by-hook', hook_type)):
+        for file in sorted(files):
+            if file.endswith('.csr'):
+                name = file.removesuffix('.csr').removesuffix('.rsa').removesuffix('.ecdsa')
+                groups.setdefault(os.path.join(root, name), []).append(os.path.join(root, file))
+    return list(groups.values())
 
-    q = "-q " if quiet else ""
-    if use_with_dns_hook:
-        cmdline = f"python3 acme_hooked.py {q}--account-key {options['LE_ACCOUNT_KEY']} --dns-hook {os.path.join(BASEDIR, 'hooks', 'dns', options['DNS_HOOK'])} {use_with_dns_hook} --directory-url {endpoint}"
-        subprocess.run(cmdline.split(' '))
-    if use_with_http_hook:
-        cmdline = f"python3 acme_hooked.py {q}--account-key {options['LE_ACCOUNT_KEY']} --http-hook {os.path.join(BASEDIR, 'hooks', 'http', options['HTTP_HOOK'])} {use_with_http_hook} --directory-url {endpoint}"
-        subprocess.run(cmdline.split(' '))
+def find_crt(csr):
+    # where the bundled hooks put the certificate: next to the csr (nginx.sh), next to the file it links to, or certs/<name>.crt (cloudns.sh)
+    candidates = [csr.removesuffix('.csr') + '.crt', os.path.realpath(csr).removesuffix('.csr') + '.crt',
+                  os.path.join(BASEDIR, 'certs', os.path.basename(csr).removesuffix('.csr') + '.crt')]
+    return next((crt for crt in candidates if os.path.isfile(crt)), None)
+
+# state/inventory.json maps each csr to the parsed details of its certificate and when that was issued. Certificates
+# acmectl renews are recorded from what sign_crts returns (record_issued), wherever the write hook puts them. Only
+# for csrs without such a record (certificates from getone, or from before the inventory) is the certificate looked
+# for where the bundled hooks put it (find_crt), and parsed again when its mtime or size changed.
+_INVENTORY_LOCK = threading.Lock()
+
+def record_issued(issued):
+    with _INVENTORY_LOCK:
+        inventory = acme_hooked._load_json(INVENTORY)
+        for csr, crt in issued:
+            try:
+                inventory[csr] = dict(acme_hooked.cert_info(crt.encode()), sha256=hashlib.sha256(crt.encode()).hexdigest(), issued=time.time_ns())
+            except (ValueError, KeyError) as error:
+                LOGGER.warning(f"Cannot parse the certificate issued for {csr}: {error}")
+                inventory.pop(csr, None)
+        acme_hooked._save_json(INVENTORY, inventory)
+
+def refresh_inventory(csrs):
+    # the inventory for csrs, with their certificates found on disk parsed (in-process, see acme_hooked.cert_info)
+    # if they changed, so a run over an unchanged tree is a stat() per file
+    with _INVENTORY_LOCK:
+        inventory, changed = acme_hooked._load_json(INVENTORY), False
+        for csr in csrs:
+            entry = inventory.get(csr)
+            if entry and 'crt' not in entry: # recorded by record_issued
+                continue
+            crt = find_crt(csr)
+            if not crt:
+                changed |= inventory.pop(csr, None) is not None
+                continue
+            stat = os.stat(crt)
+            if entry and entry['crt'] == crt and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                continue
+            with open(crt, 'rb') as file:
+                digest = hashlib.sha256(file.read()).hexdigest()
+            if not entry or entry['sha256'] != digest:
+                try:
+                    entry = dict(acme_hooked.cert_info(crt), sha256=digest)
+                except (IOError, ValueError, KeyError) as error:
+                    LOGGER.warning(f"Cannot parse {crt}, treating it as missing: {error}")
+                    changed |= inventory.pop(csr, None) is not None
+                    continue
+            inventory[csr] = dict(entry, crt=crt, mtime=stat.st_mtime_ns, size=stat.st_size, issued=stat.st_mtime_ns)
+            changed = True
+        for csr in [csr for csr in inventory if csr not in csrs]:
+            del inventory[csr]
+            changed = True
+        if changed:
+            acme_hooked._save_json(INVENTORY, inventory)
+        return inventory
+
+def plan(jobs, shards, force=False):
+    # keep only the csrs that are due: no (readable) certificate, a csr that was regenerated after the certificate
+    # was issued (new key or SANs), or a certificate whose renewal time has come. That is a random point in the
+    # CA's ARI renewal window or, if the CA doesn't offer one, RENEW_THRESHOLD days before notAfter.
+    # Returns the due jobs, why each csr is due, the CertIDs of the certificates they replace and when each csr
+    # is (or was) due. Renewal info comes from the CA that issued each certificate (see issued()), or from the
+    # first shard of the csr for certificates of unknown origin.
+    csrs = [csr for hook_type, csrs in jobs for csr in csrs]
+    inventory = refresh_inventory(set(csrs))
+    issuers = load_shard_state()['issuers']
+    cert_ids = {inventory[csr]['cert_id']: issuers.get(inventory[csr]['cert_id'].split('.')[0]) or rank(shards, csr)[0]['endpoint']
+                for csr in csrs if csr in inventory and inventory[csr]['cert_id']}
+    try:
+        ari = acme_hooked.renewal_info(cert_ids, cache_file=RENEWAL_INFO, concurrency=CONCURRENCY)
+    except (IOError, ValueError) as error:
+        LOGGER.warning(f"Cannot get renewal info, falling back to RENEW_THRESHOLD: {error}")
+        ari = {}
+
+    now = time.time()
+    date = lambda timestamp: time.strftime('%Y-%m-%d %H:%M', time.gmtime(timestamp))
+    def due(csr):
+        entry = inventory.get(csr)
+        if force:
+            return 0, "forced"
+        if not entry:
+            return 0, "no certificate"
+        if os.stat(csr).st_mtime_ns > entry['issued']:
+            return 0, "csr is newer than certificate"
+        if entry['cert_id'] in ari:
+            renew_at = ari[entry['cert_id']]['renew_at']
+            return renew_at, f"ARI renewal time {date(renew_at)}"
+        return entry['not_after'] - RENEW_THRESHOLD * 86400, f"expires {date(entry['not_after'])}"
+    deadlines = {csr: due(csr) for csr in csrs}
+    reasons = {csr: reason if at <= now else None for csr, (at, reason) in deadlines.items()}
+    planned = [(hook_type, [csr for csr in csrs if reasons[csr]]) for hook_type, csrs in jobs]
+    replaces = {csr: inventory[csr]['cert_id'] for csr in csrs if csr in inventory}
+    return [(hook_type, csrs) for hook_type, csrs in planned if csrs], reasons, replaces, {csr: at for csr, (at, reason) in deadlines.items()}
+
+def hook_list(hook_type):
+    return [os.path.join(BASEDIR, 'hooks', hook_type, options[f'{hook_type.upper()}_HOOK'])]
+
+def deploy(renewed):
+    # call each hook's deploy once for all of its renewed certificates (hook_type, csr), e.g. a single nginx
+    # reload per run instead of one per certificate. Returns the csrs whose deployment failed.
+    failed = []
+    for hook_type in sorted(set(hook_type for hook_type, csr in renewed)):
+        csrs = [csr for h, csr in renewed if h == hook_type]
+        try:
+            acme_hooked.deploy_crts(hook_list(hook_type), csrs)
+        except IOError as error:
+            LOGGER.error(f"Deploying {len(csrs)} {hook_type} certificate(s) failed: {error}")
+            failed += csrs
+    return failed
+
+def renew(hook_type, csrs, shard, replaces=None):
+    # renew the csrs on one shard with a single sign_crts call: batch and serve hooks get all of its setups, checks
+    # and removals at once, and the second key type of a certificate name, ordered in a later wave, usually finds
+    # its authorizations already valid. Errors are returned per csr, not raised, so one bad domain can't stop the
+    # others: if the call fails as a whole for a reason that isn't the CA's, the csrs are renewed one by one.
+    # replaces maps csrs to the CertID of the certificate being renewed, which the CA uses for ARI.
+    hook, replaces = hook_list(hook_type), replaces or {}
+    sign = lambda csrs, replaces: acme_hooked.sign_crts(
+        account_key=shard['account_key'],
+        csr=csrs,
+        directory_url=shard['endpoint'],
+        hook=hook,
+        challenge_type=hook_type,
+        replaces=replaces,
+        concurrency=CONCURRENCY,
+        hook_mode=HOOK_MODE,
+        dns_resolvers=DNS_RESOLVERS if hook_type == 'dns' else None,
+        dns_quorum=DNS_QUORUM,
+        session_cache=SESSION_CACHE,
+        authz_cache=AUTHZ_CACHE,
+        journal=JOURNAL,
+        rate_limits=RATE_LIMITS,
+        eab=shard['eab'],
+        trace=TRACE
+    )
+    if len(csrs) > 1:
+        try:
+            record_issued(sign(csrs, replaces))
+            return [(csr, None) for csr in csrs]
+        except Exception as error:
+            missing = getattr(error, 'missing', None)
+            if missing is not None: # orders that failed; the other certificates were written
+                record_issued(error.written)
+                for csr in missing:
+                    LOGGER.error(f"Renewing {csr} failed: {error}")
+                return [(csr, error if csr in missing else None) for csr in csrs]
+            if ca_error(error):
+                LOGGER.error(f"Renewing {len(csrs)} certificates on shard {shard['name']} failed: {error}")
+                return [(csr, error) for csr in csrs]
+            LOGGER.warning(f"Renewing {len(csrs)} certificates together failed, renewing them one by one: {error}")
+    results = []
+    for csr in csrs:
+        try:
+            try:
+                record_issued(sign([csr], replaces.get(csr)))
+            except ValueError as error:
+                # the CA refuses replaces for certificates it didn't issue or that were already replaced
+                if not replaces.get(csr) or 'Error creating new order' not in str(error) or 'replace' not in str(error).lower():
+                    raise
+                LOGGER.warning(f"CA did not accept replaces for {csr}, ordering a new certificate: {error}")
+                record_issued(sign([csr], None))
+            results.append((csr, None))
+        except Exception as error:
+            LOGGER.error(f"Renewing {csr} failed: {error}")
+            results.append((csr, error))
+    return results
+
+# === Shards ===
+# The [shards] section of acmectl.conf spreads certificates over several accounts and CAs, as
+# `name = ENDPOINT account_key [weight [eab_kid eab_hmac_key]]`. Without it (or in test mode) there is one shard:
+# the endpoint from the command line with LE_ACCOUNT_KEY. Each certificate name has a fixed order of shards
+# (weighted rendezvous hashing), so it stays with its account and CA as long as the shard is up, and only the
+# certificates of an added or removed shard move. Renewals that fail for reasons that are the CA's (network and
+# server errors, rate limits) fail over to the next shard. state/shards.json keeps per-shard counters, which shards
+# are down, and which CA issued which intermediate (by AKI) so renewal info is asked from the right CA.
+_SHARD_LOCK, _SHARD_SLOTS = threading.Lock(), {}
+
+def load_shards(endpoint, test=False, create_keys=True):
+    if test or not config.has_section('shards') or not config['shards']:
+        return [{'name': 'default', 'endpoint': endpoint, 'account_key': os.path.join(BASEDIR, options['LE_ACCOUNT_KEY']), 'weight': 1.0, 'eab': None}]
+    shards = []
+    for name, value in config['shards'].items():
+        fields = value.split()
+        if len(fields) < 2 or len(fields) == 4:
+            die(f"Shard {name} needs an endpoint and an account key, and optionally a weight and both EAB values.")
+        shards.append({'name': name, 'endpoint': endpoints.get(fields[0], fields[0]), 'account_key': os.path.join(BASEDIR, fields[1]),
+                       'weight': float(fields[2]) if len(fields) > 2 else 1.0, 'eab': tuple(fields[3:5]) or None})
+        if create_keys and not os.path.isfile(shards[-1]['account_key']):
+            write_key(shards[-1]['account_key'], 'rsa')
+    return shards
+
+def load_shard_state():
+    return dict({'issuers': {}, 'shards': {}}, **acme_hooked._load_json(SHARD_STATE))
+
+def rank(shards, csr):
+    # the shards to try for a certificate name, best first; shards that are down go last
+    name = os.path.basename(csr).removesuffix('.csr').removesuffix('.rsa').removesuffix('.ecdsa')
+    def score(shard):
+        digest = int.from_bytes(hashlib.sha256(f"{shard['name']}/{name}".encode()).digest()[:8], 'big')
+        return shard['weight'] / -math.log((digest + 1) / 2 ** 64)
+    down = load_shard_state()['shards']
+    ranked = sorted(shards, key=score, reverse=True)
+    return sorted(ranked, key=lambda shard: down.get(shard['name'], {}).get('down_until', 0) > time.time())
+
+def ca_error(error):
+    # failures that are the CA's or the account's rather than the domain's: what the request governor gave up on
+    # (network and server errors) or deferred (rate limits, exhausted budgets), by the status and problem type
+    # acme_hooked gives its errors
+    status, problem = getattr(error, 'status', 0), getattr(error, 'problem', None)
+    return status is None or status == 429 or (status or 0) >= 500 or problem == 'urn:ietf:params:acme:error:rateLimited'
+
+def issued(shard, results, seconds):
+    # update a shard's counters and health after renewing on it, and remember which CA issued the certificates
+    with _SHARD_LOCK:
+        state = load_shard_state()
+        stats = state['shards'].setdefault(shard['name'], {'issued': 0, 'failed': 0, 'seconds': 0.0, 'consecutive': 0, 'down_until': 0})
+        stats['seconds'] += seconds
+        inventory = acme_hooked._load_json(INVENTORY) # renew() recorded the new certificates
+        for csr, error in results:
+            if error is None:
+                stats['issued'] += 1
+                stats['consecutive'] = 0
+                cert_id = inventory.get(csr, {}).get('cert_id')
+                if cert_id:
+                    state['issuers'][cert_id.split('.')[0]] = shard['endpoint']
+                continue
+            stats['failed'] += 1
+            stats['last_error'] = str(error).splitlines()[0]
+            if ca_error(error) and not getattr(error, 'subject', None): # a rate limit on some domains says nothing about the shard
+                stats['consecutive'] += 1
+                if stats['consecutive'] >= SHARD_FAILURES and stats['down_until'] < time.time():
+                    LOGGER.warning(f"Shard {shard['name']} failed {stats['consecutive']} times in a row, skipping it for {SHARD_COOLDOWN}s.")
+                    stats['down_until'] = time.time() + SHARD_COOLDOWN
+        acme_hooked._save_json(SHARD_STATE, state)
+
+def renew_sharded(hook_type, csrs, shards, replaces=None, ranking=None):
+    # renew on the first shard of the certificate name; csrs that fail there because of the CA move on to the next
+    results, pending = {}, list(csrs)
+    for i, shard in enumerate(ranking or rank(shards, csrs[0])):
+        if i:
+            LOGGER.warning(f"Failing over {', '.join(os.path.basename(csr) for csr in pending)} to shard {shard['name']}.")
+        with _SHARD_LOCK: # each shard renews at most WORKERS batches at a time
+            slots = _SHARD_SLOTS.setdefault(shard['name'], threading.Semaphore(WORKERS))
+        with slots:
+            start = time.time()
+            attempt = renew(hook_type, pending, shard, replaces)
+            issued(shard, attempt, time.time() - start)
+        results.update(attempt)
+        pending = [csr for csr, error in attempt if error is not None and ca_error(error)]
+        if not pending:
+            break
+    return [(csr, results[csr]) for csr in csrs]
+
+def shard_report(shards, since=None):
+    # one line per shard: its counters (since a snapshot of load_shard_state()['shards'], if given) and health
+    lines, state = [], load_shard_state()['shards']
+    for shard in shards:
+        stats, before = state.get(shard['name'], {}), (since or {}).get(shard['name'], {})
+        delta = {key: stats.get(key, 0) - before.get(key, 0) for key in ['issued', 'failed', 'seconds']}
+        per_certificate = f", {delta['seconds'] / delta['issued']:.1f}s per certificate" if delta['issued'] else ""
+        down = f", down until {time.strftime('%H:%M', time.localtime(stats['down_until']))}" if stats.get('down_until', 0) > time.time() else ""
+        lines.append(f"{shard['name']} ({shard['endpoint']}): {delta['issued']} issued, {delta['failed']} failed{per_certificate}{down}")
+    return lines
+
+# === Metrics ===
+# state/acmectl.prom is a textfile for node-exporter's textfile collector (point --collector.textfile.directory at
+# state/, or link the file into its directory), rewritten after every unattended run and daemon scan: when each
+# certificate expires, the per-shard counters, and the spans and counters acme_hooked traced in this process (a
+# process is one unattended run, or the daemon's lifetime). The caller adds its own gauges as
+# (name, help, {labels: value}). The spans themselves are in state/trace.jsonl (see _span in acme_hooked.py).
+def write_metrics(shards, gauges=None):
+    label = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"')
+    jobs = [(hook_type, csr) for hook_type in ['dns', 'http'] for csrs in find_csrs(hook_type) for csr in csrs]
+    inventory = refresh_inventory(set(csr for hook_type, csr in jobs))
+    expiry = {f'hook="{hook_type}",certificate="{label(os.path.basename(csr).removesuffix(".csr"))}"': inventory[csr]['not_after']
+              for hook_type, csr in jobs if csr in inventory}
+    shard_state, stats = load_shard_state()['shards'], acme_hooked.trace_stats()
+    shard_stats = lambda key: {f'shard="{label(shard["name"])}"': shard_state.get(shard['name'], {}).get(key, 0) for shard in shards}
+    metrics = [('acmectl_certificate_expiry_timestamp_seconds', 'gauge', 'When the certificate expires.', expiry),
+               ('acmectl_shard_up', 'gauge', 'Whether the shard is used for new orders.', {labels: int(down_until <= time.time()) for labels, down_until in shard_stats('down_until').items()}),
+               ('acmectl_shard_issued_total', 'counter', 'Certificates issued on the shard.', shard_stats('issued')),
+               ('acmectl_shard_failed_total', 'counter', 'Failed renewals on the shard.', shard_stats('failed')),
+               ('acmectl_spans_total', 'counter', 'Traced requests, signatures, subprocesses, hook calls, polls and phases.', {f'span="{name}"': count for name, (count, seconds) in stats['spans'].items()}),
+               ('acmectl_span_seconds_total', 'counter', 'Time spent in each kind of span.', {f'span="{name}"': round(seconds, 6) for name, (count, seconds) in stats['spans'].items()}),
+               ('acmectl_events_total', 'counter', 'Bad nonces, retries, nonce fetches, redirects and poll iterations.', {f'event="{name}"': count for name, count in stats['counters'].items()})]
+    metrics += [(name, 'gauge', help, values) for name, help, values in gauges or []]
+    lines = []
+    for name, kind, help, values in metrics:
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"] + [f"{name}{{{labels}}} {value}" if labels else f"{name} {value}" for labels, value in sorted(values.items())]
+    acme_hooked._save_file(METRICS, "\n".join(lines) + "\n")
+
+def unattended(shards, force=False, dry_run=False):
+    # DNS and HTTP certificates share one worker pool (and, inside acme_hooked, one session per account);
+    # the shards renew side by side, WORKERS certificate names each
+    if not dry_run and not force and query_daemon('health'):
+        LOGGER.info(f"The acmectl daemon is running ({DAEMON_SOCKET}); leaving renewals to it.")
+        return
+    jobs = [(hook_type, csrs) for hook_type in ['dns', 'http'] for csrs in find_csrs(hook_type)]
+    total = sum(len(csrs) for hook_type, csrs in jobs)
+    jobs, reasons, replaces, deadlines = plan(jobs, shards, force)
+    LOGGER.info(f"{sum(len(csrs) for hook_type, csrs in jobs)} of {total} certificates are due for renewal.")
+    # don't start more orders than fit in the shards' newOrder budgets: the most urgent certificate names go first,
+    # each to the first of its shards with room left; the least urgent ones wait for the next run
+    budgets = {shard['name']: acme_hooked.rate_budget(shard['endpoint'], "newOrder", state_file=RATE_LIMITS, account_key=shard['account_key'])
+               if os.path.isfile(shard['account_key']) else acme_hooked.RATE_LIMITS["newOrder"][0] for shard in shards} # a new account (dry run) has all of it
+    rankings, deferred = {}, set()
+    for hook_type, csrs in sorted(jobs, key=lambda job: min(deadlines[csr] for csr in job[1])):
+        ranking = rank(shards, csrs[0])
+        fits = [i for i, shard in enumerate(ranking) if budgets[shard['name']] >= len(csrs)]
+        if not fits:
+            deferred.update(csrs)
+            continue
+        budgets[ranking[fits[0]]['name']] -= len(csrs)
+        rankings[csrs[0]] = ranking[fits[0]:]
+    if deferred:
+        LOGGER.warning(f"The CAs' rate limits leave no room for {len(deferred)} renewals right now, deferring them to the next run.")
+        jobs = [(hook_type, csrs) for hook_type, csrs in jobs if csrs[0] not in deferred]
+    if dry_run:
+        # one line per csr: due or not, why, the CertID its order would replace and the shard it would go to
+        shard_names = {csr: rankings[csrs[0]][0]['name'] for hook_type, csrs in jobs for csr in csrs}
+        for csr, reason in reasons.items():
+            print(f"{'defer' if csr in deferred else 'renew' if reason else 'skip'}\t{os.path.relpath(csr, BASEDIR)}\t{reason or 'not due'}\t{replaces.get(csr, '') if reason else ''}\t{shard_names.get(csr, '')}".rstrip('\t'))
+        return
+    # certificate names with the same hook type and shards are renewed together, in up to WORKERS batches of whole
+    # names, so each shard still renews WORKERS batches side by side (see renew)
+    groups = {}
+    for hook_type, csrs in jobs:
+        groups.setdefault((hook_type, tuple(shard['name'] for shard in rankings[csrs[0]])), []).append(csrs)
+    batches = [(hook_type, sum(names[i::WORKERS], [])) for (hook_type, _), names in groups.items() for i in range(min(WORKERS, len(names)))]
+    before = load_shard_state()['shards']
+    with ThreadPoolExecutor(max_workers=WORKERS * len(shards)) as executor:
+        results = [result for results in executor.map(lambda batch: renew_sharded(batch[0], batch[1], shards, replaces, rankings[batch[1][0]]), batches) for result in results]
+    hook_types = {csr: hook_type for hook_type, csrs in jobs for csr in csrs}
+    undeployed = deploy([(hook_types[csr], csr) for csr, error in results if error is None])
+
+    failed = [csr for csr, error in results if error is not None] + undeployed
+    for csr, error in results:
+        LOGGER.info(f"\t{'FAILED' if error else 'ok'}\t{os.path.relpath(csr, BASEDIR)}")
+    LOGGER.info(f"Renewed {len(results) - len(failed)} of {len(results)} certificates.")
+    write_metrics(shards, [('acmectl_last_run_timestamp_seconds', 'When the last unattended run finished.', {'': round(time.time())}),
+                           ('acmectl_last_run_certificates', 'Certificates the last unattended run renewed, failed to renew or deferred.',
+                            {'result="renewed"': len(results) - len(failed), 'result="failed"': len(failed), 'result="deferred"': len(deferred)})])
+    if len(shards) > 1:
+        for line in shard_report(shards, before):
+            LOGGER.info(f"\t{line}")
+    if failed:
+        die(f"{len(failed)} certificate(s) failed to renew: {', '.join(os.path.basename(csr) for csr in failed)}")
+
+def query_daemon(command):
+    # ask a running daemon for 'health' or 'status' over its unix socket; None if nobody answers
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(DAEMON_SOCKET)
+            sock.sendall(command.encode() + b'\n')
+            return json.loads(sock.makefile('rb').readline())
+    except (OSError, ValueError):
+        return None
+
+def watched():
+    # the files the daemon reacts to: everything under by-hook/ (following the links to certs/) and the
+    # .san, .csr and .crt files in certs/, with their mtimes
+    files = {}
+    for root, dirs, names in os.walk(os.path.join(BASEDIR, 'by-hook')):
+        files.update({os.path.join(root, name): None for name in names})
+    files.update({os.path.join(BASEDIR, 'certs', name): None for name in os.listdir(os.path.join(BASEDIR, 'certs')) if name.endswith(('.san', '.csr', '.crt'))})
+    for path in files:
+        try:
+            files[path] = os.stat(path).st_mtime_ns
+        except OSError: # dangling link
+            pass
+    return files
+
+def daemon(shards):
+    # Long-running alternative to the timer. One process keeps the ACME session, its connections and the parsed
+    # certificates warm, polls by-hook/ and certs/ every DAEMON_POLL seconds, and keeps a queue of the deadlines
+    # plan() computes. Like unattended, it renews certificate names: when the first csr of a name comes due, its due
+    # csrs are renewed in one go, at most WORKERS names per shard at a time; failures are retried
+    # after DAEMON_RETRY seconds, doubling each time. A changed .san regenerates its CSRs (genall), which makes them
+    # due. Everything is re-planned whenever a watched file changes, a renewal finishes, or hourly for ARI.
+    # `acmectl.py status` asks the daemon how it's doing over DAEMON_SOCKET; while it answers, `unattended`
+    # (i.e. the timer) leaves renewals to it.
+    if query_daemon('health'):
+        die(f"Another daemon is listening on {DAEMON_SOCKET}.")
+    lock, wake, rescan = threading.Lock(), threading.Event(), threading.Event()
+    state = {'started': time.time(), 'scanned': None, 'error': None, 'queue': [], 'due': {}, 'hook_types': {}, 'reasons': {}, 'replaces': {},
+             'running': {}, 'renewing': 0, 'failures': {}, 'last': {}, 'undeployed': [], 'shards': load_shard_state()['shards']}
+    date = lambda timestamp: time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp)) if timestamp is not None else None
+    relpath = lambda csr: os.path.relpath(csr, BASEDIR)
+
+    def report(command):
+        now = time.time()
+        with lock:
+            health = {'status': 'ok' if state['error'] is None else 'error', 'pid': os.getpid(), 'uptime': int(now - state['started']),
+                      'scanned': date(state['scanned']), 'error': state['error'], 'certificates': sum(len(csrs) for at, csrs in state['queue']) + len(state['running']),
+                      'due': sum(1 for at, csrs in state['queue'] for csr in csrs if state['due'][csr] <= now), 'running': len(state['running']), 'failing': len(state['failures']), 'undeployed': len(state['undeployed'])}
+            if command == 'health':
+                return health
+            return dict(health,
+                        queue=[{'csr': relpath(csr), 'hook': state['hook_types'][csr], 'due': date(state['due'][csr]), 'reason': state['reasons'].get(csr)} for at, csrs in sorted(state['queue']) for csr in csrs],
+                        running={relpath(csr): date(since) for csr, since in state['running'].items()},
+                        failures={relpath(csr): {'count': count, 'retry': date(retry)} for csr, (count, retry) in state['failures'].items()},
+                        last={relpath(csr): {'finished': date(finished), 'error': error} for csr, (finished, error) in state['last'].items()},
+                        shards=shard_report(shards, state['shards']))
+
+    class StatusHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            command = self.rfile.readline().decode().strip()
+            self.wfile.write(json.dumps(report(command)).encode() + b'\n')
+
+    def renewed(hook_type, csrs, replaces):
+        # whatever happens, the csrs stop running (else they'd never be queued again, and nothing deployed)
+        results = []
+        try:
+            results = renew_sharded(hook_type, csrs, shards, replaces)
+        except Exception as error:
+            LOGGER.error(f"Renewing {', '.join(relpath(csr) for csr in csrs)} failed: {error}")
+            results = [(csr, error) for csr in csrs]
+        finally:
+            results = dict(results)
+            with lock:
+                state['renewing'] -= 1
+                for csr in csrs:
+                    error = results.get(csr, "renewal was interrupted")
+                    del state['running'][csr]
+                    state['last'][csr] = (time.time(), str(error) if error else None)
+                    if error:
+                        count = state['failures'].get(csr, (0, 0))[0] + 1
+                        state['failures'][csr] = (count, time.time() + min(DAEMON_RETRY * 2 ** (count - 1), 86400))
+                    else:
+                        state['failures'].pop(csr, None)
+                        if (hook_type, csr) not in state['undeployed']:
+                            state['undeployed'].append((hook_type, csr))
+            rescan.set()
+            wake.set()
+
+    if os.path.exists(DAEMON_SOCKET):
+        os.unlink(DAEMON_SOCKET) # left behind by a daemon that is gone
+    server = socketserver.ThreadingUnixStreamServer(DAEMON_SOCKET, StatusHandler)
+    server.daemon_threads = True
+    os.chmod(DAEMON_SOCKET, 0o600)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    LOGGER.info(f"Daemon started, listening on {DAEMON_SOCKET}.")
+
+    executor = ThreadPoolExecutor(max_workers=WORKERS * len(shards))
+    seen, next_scan, deploy_due = None, 0, False
+    try:
+        while True:
+            wake.clear()
+            files = watched()
+            if files != seen or rescan.is_set() or time.time() >= next_scan:
+                rescan.clear()
+                deploy_due, scan_started = True, time.time()
+                sans = lambda files: {path: mtime for path, mtime in files.items() if path.endswith('.san')}
+                try:
+                    if seen is not None and sans(files) != sans(seen):
+                        LOGGER.info("SAN files changed, regenerating CSRs.")
+                        genall()
+                        files = watched()
+                    jobs = [(hook_type, csrs) for hook_type in ['dns', 'http'] for csrs in find_csrs(hook_type)]
+                    planned, reasons, replaces, deadlines = plan(jobs, shards)
+                    with lock:
+                        # plan() ran without the lock: a renewal that finished meanwhile has a stale deadline (its
+                        # new certificate wasn't planned), so leave its name out; the rescan it asked for queues it
+                        # again. So are names with a renewal still running: their csrs are ordered together.
+                        stale = set(state['running']) | set(csr for csr, (finished, error) in state['last'].items() if finished >= scan_started)
+                        state['hook_types'] = {csr: hook_type for hook_type, csrs in jobs for csr in csrs}
+                        state['reasons'], state['replaces'] = reasons, replaces
+                        state['failures'] = {csr: failure for csr, failure in state['failures'].items() if csr in deadlines}
+                        state['due'] = {csr: max(at, state['failures'].get(csr, (0, 0))[1]) for csr, at in deadlines.items()}
+                        state['queue'] = [(min(state['due'][csr] for csr in csrs), tuple(csrs)) for hook_type, csrs in jobs if not stale.intersection(csrs)]
+                        heapq.heapify(state['queue'])
+                        state['scanned'], state['error'] = time.time(), None
+                    LOGGER.info(f"Planned {len(deadlines)} certificates, {sum(len(csrs) for hook_type, csrs in planned)} due.")
+                    health = report('health')
+                    write_metrics(shards, [('acmectl_daemon_certificates', 'Certificates the daemon has queued, due, running, failing or not yet deployed.',
+                                            {f'state="{key}"': health[key] for key in ['certificates', 'due', 'running', 'failing', 'undeployed']})])
+                except Exception as error:
+                    LOGGER.error(f"Planning renewals failed: {error}")
+                    with lock:
+                        state['error'] = str(error)
+                seen, next_scan = files, time.time() + 3600
+
+            # deploy once the renewals that came due together are all done; failed deployments are retried
+            # after the next scan (when files change, a renewal finishes, or hourly)
+            with lock:
+                undeployed, state['undeployed'] = (state['undeployed'], []) if deploy_due and not state['renewing'] else ([], state['undeployed'])
+            if undeployed:
+                failed = deploy(undeployed)
+                with lock:
+                    state['undeployed'] += [(hook_type, csr) for hook_type, csr in undeployed if csr in failed]
+            deploy_due = False
+
+            now = time.time()
+            with lock:
+                while state['queue'] and state['queue'][0][0] <= now and state['renewing'] < WORKERS * len(shards):
+                    at, csrs = heapq.heappop(state['queue'])
+                    csrs = [csr for csr in csrs if state['due'][csr] <= now]
+                    for csr in csrs:
+                        LOGGER.info(f"Renewing {relpath(csr)}: {state['reasons'].get(csr) or 'retrying'}.")
+                        state['running'][csr] = now
+                    state['renewing'] += 1
+                    executor.submit(renewed, state['hook_types'][csrs[0]], csrs, {csr: state['replaces'].get(csr) for csr in csrs})
+                idle = state['queue'][0][0] - now if state['queue'] and state['renewing'] < WORKERS * len(shards) else DAEMON_POLL
+            wake.wait(max(0, min(idle, DAEMON_POLL)))
+    finally:
+        LOGGER.info("Daemon stopping, waiting for running renewals to finish.")
+        server.shutdown()
+        os.unlink(DAEMON_SOCKET)
+        executor.shutdown()
 
 def main(argv=None):
     parser = argparse.ArgumentParser(
@@ -107,6 +684,11 @@ def main(argv=None):
     gencsr_parser = subparsers.add_parser("gencsr", help="Generate CSR")
     gencsr_parser.add_argument("name", help="base name (usually domain)")
 
+    genall_parser = subparsers.add_parser("genall", help="Generate missing keys and stale CSRs for every certs/*.san")
+    genall_parser.add_argument("--mode", choices=["rsa", "ecdsa", "both"], default="both", help="key types to generate")
+    genall_parser.add_argument("--curve", default=config["general"]["CURVE"], help="curve for ECDSA keys")
+    genall_parser.add_argument("--pool", type=int, default=0, metavar="N", help="afterwards, pre-generate keys until state/keypool/ holds N of each type")
+
     # Define usage text explicitly because order of arguments matters. Upstream bug: https://github.com/python/cpython/issues/53584
     # nargs='?' will 'steal' positional arguments (which makes sense, not sure how they will fix that bug). 
     # One solution would be if argparse (or another library, but I am reluctant to use those) supported --arg=value syntax
@@ -119,8 +701,16 @@ def main(argv=None):
     quickstart_parser.add_argument("name", help="base name (usually domain)")
 
     unattended_parser = subparsers.add_parser("unattended", help="Renew certificates without user interaction")
+    unattended_parser.add_argument("--dry-run", action="store_true", help="print which certificates would be renewed and why, then exit")
+    unattended_parser.add_argument("--force", action="store_true", help="renew all certificates, not just those within RENEW_THRESHOLD days of expiry")
+
+    subparsers.add_parser("daemon", help="Keep running and renew certificates as they come due")
+
+    status_parser = subparsers.add_parser("status", help="Show what the running daemon is doing")
+    status_parser.add_argument("--health", action="store_true", help="only print a health summary; exit status 1 if the daemon is unhealthy")
 
     args = parser.parse_args(argv)
+    logging.basicConfig(format='[acmectl] %(message)s', level=logging.ERROR if args.quiet else logging.INFO)
 
     endpoint = endpoints["LE_STAGING"] if args.test else endpoints[args.endpoint] 
 
@@ -129,24 +719,38 @@ def main(argv=None):
         use_hook = "--" + hook_type + "-hook " + os.path.join(BASEDIR, "hooks", hook_type, args.http_hook or args.dns_hook)
         LOGGER.info(f"Using {hook_type} hook: {use_hook}")
 
-    LOGGER.info(f"Startup configuration:\n\tendpoint: {endpoint}\n\ttest mode: {args.test}")
-
-    # Map commands to functions
-    if args.command == "genkey":
-        genkey(args.mode, args.name, args.curve)
-    elif args.command == "gencsr":
-        gencsr(args.name)
-    elif args.command == "getone":
-        getone(args.name, use_hook, endpoint, quiet=args.quiet)
-    elif args.command == "unattended":
-        unattended(endpoint, quiet=args.quiet)
-    elif args.command == "quickstart":
-        quickstart(args.name, use_hook, endpoint)  # quickstart is user-facing; quiet=False inside
-    else:
-        parser.print_help()
-        exit(1)
+    try:
+        # only renewals need the shards (whose missing account keys are created, except on a dry run)
+        shards = load_shards(endpoint, args.test, create_keys=not getattr(args, 'dry_run', False)) if args.command in ["unattended", "daemon"] else None
+        LOGGER.info(f"Startup configuration:\n\tendpoint: {endpoint}\n" + (f"\tshards: {', '.join(shard['name'] for shard in shards)}\n" if shards else "") + f"\ttest mode: {args.test}")
 
-    logging.basicConfig(format='[acmectl] %(message)s', level=logging.ERROR if args.quiet else logging.INFO)
+        # Map commands to functions
+        if args.command == "genkey":
+            genkey(args.mode, args.name, args.curve)
+        elif args.command == "gencsr":
+            gencsr(args.name)
+        elif args.command == "genall":
+            genall(args.mode, args.curve, args.pool)
+        elif args.command == "getone":
+            getone(args.name, use_hook, endpoint, quiet=args.quiet)
+        elif args.command == "unattended":
+            unattended(shards, force=args.force, dry_run=args.dry_run)
+        elif args.command == "daemon":
+            daemon(shards)
+        elif args.command == "status":
+            reply = query_daemon('health' if args.health else 'status')
+            if reply is None:
+                die(f"No daemon is listening on {DAEMON_SOCKET}.")
+            print(json.dumps(reply, indent=1))
+            if reply['status'] != 'ok':
+                exit(1)
+        elif args.command == "quickstart":
+            quickstart(args.name, use_hook, endpoint)  # quickstart is user-facing; quiet=False inside
+        else:
+            parser.print_help()
+            exit(1)
+    except IOError as error: # e.g. openssl failed to generate a key
+        die(str(error))
 
 if __name__ == "__main__": # pragma: no cover
     main(sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,13 @@
+#!/usr/bin/env bash
+# No-op hook for benchmarks against bench/mock_acme.py, which passes every challenge without looking:
+# setup/check/remove/activate/finish/deploy do nothing, write saves the certificate next to the csr
+# (where acmectl looks for it). Speaks the batch/serve protocol too, so every --hook-mode can be measured.
+
+if [[ "$1" == 'write' ]]; then
+	cat > "${2%.csr}.crt"
+elif [[ "$1" == 'batch' || "$1" == 'serve' ]]; then
+	while IFS= read -r line; do
+		[[ "$line" =~ \"id\":\ *([0-9]+) ]] && echo "{\"id\":${BASH_REMATCH[1]},\"status\":\"ok\"}"
+	done
+fi
+exit 0
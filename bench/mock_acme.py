@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# Mock ACME (RFC 8555) server for offline benchmarks and tests: directory, nonces, accounts, orders, authorizations,
+# challenges, finalize, certificate download and renewal info (RFC 9773), issuing from a throwaway CA with openssl.
+# It checks nonces and account urls but no signatures, and every challenge passes once it has been submitted (after
+# --validation-delay), so it needs no hooks that actually do anything. Not secure, not complete.
+# usage: python3 bench/mock_acme.py [--port 14000] [--latency 0.05] [--bad-nonce 0.1] [--rate-limit 0.05] ...
+# GET /stats returns the number of requests per endpoint and of injected errors.
+
+import argparse, base64, itertools, json, os, random, subprocess, sys, tempfile, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+def b64d(data):
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def b64(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+class State:
+    def __init__(self, opts):
+        self.opts = opts
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.nonces, self.kids, self.replaced = set(), set(), set()
+        self.accounts, self.orders, self.authzs, self.certs, self.counts = {}, {}, {}, {}, {}
+        self.run = os.urandom(4).hex() # account urls of an earlier instance are unknown to this one
+        self.tmp = tempfile.mkdtemp()
+        self.ca_key, self.ca_crt = os.path.join(self.tmp, "ca.key"), os.path.join(self.tmp, "ca.crt")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", self.ca_key, "-out", self.ca_crt, "-subj", "/CN=mock ca", "-days", "3650",
+                        "-addext", "subjectKeyIdentifier=hash"], check=True, capture_output=True)
+        with open(self.ca_crt, "rb") as file:
+            self.chain = file.read()
+
+    def nonce(self):
+        nonce = b64(os.urandom(16))
+        with self.lock:
+            self.nonces.add(nonce)
+        return nonce
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like a real CA
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def base(self):
+        return "http://%s:%d" % self.server.server_address[:2]
+
+    def reply(self, code, body=None, headers=None, ctype="application/json"):
+        data = b"" if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+        self.send_response(code)
+        self.send_header("Replay-Nonce", self.state.nonce())
+        self.send_header("Content-Length", str(len(data)))
+        if data:
+            self.send_header("Content-Type", ctype)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if data and self.command != "HEAD":
+            self.wfile.write(data)
+
+    def problem(self, code, problem, detail=""):
+        self.reply(code, {"type": "urn:ietf:params:acme:error:" + problem, "detail": detail}, ctype="application/problem+json",
+                   headers={"Retry-After": "1"} if code == 429 else None)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        time.sleep(self.state.opts.latency)
+        self.state.count("GET " + self.path.split("/")[1])
+        if self.path == "/directory":
+            base = self.base()
+            return self.reply(200, {"newNonce": base + "/new-nonce", "newAccount": base + "/new-account", "newOrder": base + "/new-order",
+                                    "revokeCert": base + "/revoke", "keyChange": base + "/key-change", "renewalInfo": base + "/renewal-info",
+                                    "meta": {"profiles": {"classic": "default", "shortlived": "6 days"}}})
+        if self.path == "/new-nonce":
+            return self.reply(200)
+        if self.path == "/stats":
+            with self.state.lock:
+                return self.reply(200, dict(self.state.counts))
+        if self.path.startswith("/renewal-info/"):
+            start = int(time.time() // 3600 * 3600 + self.state.opts.ari_offset)
+            window = {"start": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(start)), "end": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(start + 120))}
+            return self.reply(200, {"suggestedWindow": window}, headers={"Retry-After": "21600"})
+        self.problem(404, "malformed", "not found")
+
+    def do_POST(self):
+        time.sleep(self.state.opts.latency)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        protected = json.loads(b64d(body["protected"]))
+        payload = json.loads(b64d(body["payload"])) if body["payload"] else None
+        self.state.count("POST " + self.path.split("/")[1])
+        with self.state.lock:
+            fresh = protected["nonce"] in self.state.nonces
+            self.state.nonces.discard(protected["nonce"])
+        if not fresh or random.random() < self.state.opts.bad_nonce:
+            self.state.count("badNonce")
+            return self.problem(400, "badNonce", "bad nonce")
+        if "kid" in protected and protected["kid"] not in self.state.kids:
+            self.state.count("accountDoesNotExist")
+            return self.problem(400, "accountDoesNotExist", "no such account")
+        if random.random() < self.state.opts.rate_limit:
+            self.state.count("rateLimited")
+            return self.problem(429, "rateLimited", "slow down")
+        parts = self.path.strip("/").split("/")
+        handler = getattr(self, "post_" + parts[0].replace("-", "_"), None)
+        if handler is None:
+            return self.problem(404, "malformed", "not found")
+        with self.state.lock:
+            return handler(parts[1:], protected, payload)
+
+    def post_new_account(self, parts, protected, payload):
+        if "jwk" not in protected:
+            return self.problem(400, "malformed", "jwk required")
+        key = json.dumps(protected["jwk"], sort_keys=True)
+        created = key not in self.state.accounts
+        if created:
+            self.state.accounts[key] = next(self.state.ids)
+        kid = self.base() + "/acct/%s-%d" % (self.state.run, self.state.accounts[key])
+        self.state.kids.add(kid)
+        self.reply(201 if created else 200, {"status": "valid", "contact": payload.get("contact", [])}, headers={"Location": kid})
+
+    def post_acct(self, parts, protected, payload):
+        self.reply(200, {"status": "valid", "contact": (payload or {}).get("contact", [])})
+
+    def post_new_order(self, parts, protected, payload):
+        if "replaces" in payload:
+            self.state.count("replaces")
+            if payload["replaces"] in self.state.replaced:
+                return self.problem(409, "alreadyReplaced", "certificate already replaced")
+            self.state.replaced.add(payload["replaces"])
+        order_id, authz = next(self.state.ids), []
+        for identifier in payload["identifiers"]:
+            # like a real CA, hand out a valid authorization of the same account again
+            reuse = [authz_id for authz_id, a in self.state.authzs.items() if a["identifier"] == identifier and a["kid"] == protected.get("kid") and self._authz(authz_id)["status"] == "valid"]
+            if reuse and not self.state.opts.no_reuse:
+                authz.append(self.base() + "/authz/%d" % reuse[-1])
+                continue
+            authz_id = next(self.state.ids)
+            self.state.authzs[authz_id] = {"identifier": identifier, "status": "valid" if self.state.opts.prevalid else "pending", "expires": "2099-01-01T00:00:00Z",
+                                           "ready": None, "kid": protected.get("kid"),
+                                           "challenges": [{"type": kind, "url": self.base() + "/chall/%d/%s" % (authz_id, kind), "token": b64(os.urandom(16)), "status": "pending"}
+                                                          for kind in ("http-01", "dns-01")]}
+            authz.append(self.base() + "/authz/%d" % authz_id)
+        order = {"status": "pending", "identifiers": payload["identifiers"], "authorizations": authz, "finalize": self.base() + "/finalize/%d" % order_id, "expires": "2099-01-01T00:00:00Z"}
+        if "profile" in payload:
+            order["profile"] = payload["profile"]
+        self.state.orders[order_id] = order
+        self.reply(201, order, headers={"Location": self.base() + "/order/%d" % order_id})
+
+    def _authz(self, authz_id):
+        authz = self.state.authzs[authz_id]
+        if authz["status"] == "pending" and authz["ready"] is not None and time.time() >= authz["ready"]:
+            failing = self.state.opts.fail and authz["identifier"]["value"].startswith(self.state.opts.fail)
+            authz["status"] = "invalid" if failing else "valid"
+        return authz
+
+    def post_authz(self, parts, protected, payload):
+        authz = self._authz(int(parts[0]))
+        self.reply(200, {k: v for k, v in authz.items() if k not in ("ready", "kid")}, headers={"Retry-After": "1"} if authz["status"] == "pending" else None)
+
+    def post_chall(self, parts, protected, payload):
+        authz = self.state.authzs[int(parts[0])]
+        if authz["status"] == "pending" and authz["ready"] is None:
+            authz["ready"] = time.time() + self.state.opts.validation_delay
+        challenge = [c for c in authz["challenges"] if c["type"] == parts[1]][0]
+        self.reply(200, challenge, headers={"Link": '<%s/authz/%s>;rel="up"' % (self.base(), parts[0])})
+
+    def _order(self, order_id):
+        order = self.state.orders[order_id]
+        statuses = [self._authz(int(url.rsplit("/", 1)[1]))["status"] for url in order["authorizations"]]
+        if order["status"] == "pending" and "invalid" in statuses:
+            order["status"] = "invalid"
+        if order["status"] == "pending" and all(status == "valid" for status in statuses):
+            order["status"] = "ready"
+        if order["status"] == "processing" and time.time() >= order["ready_at"]:
+            order["status"], order["certificate"] = "valid", self.base() + "/cert/%d" % order_id
+        return order
+
+    def post_order(self, parts, protected, payload):
+        order = self._order(int(parts[0]))
+        self.reply(200, {k: v for k, v in order.items() if k != "ready_at"}, headers={"Retry-After": "1"} if order["status"] in ("pending", "processing") else None)
+
+    def post_finalize(self, parts, protected, payload):
+        order_id = int(parts[0])
+        order = self._order(order_id)
+        if order["status"] != "ready":
+            return self.problem(403, "orderNotReady", order["status"])
+        csr, ext = os.path.join(self.state.tmp, "%d.csr" % order_id), os.path.join(self.state.tmp, "%d.ext" % order_id)
+        with open(csr, "wb") as file:
+            file.write(b64d(payload["csr"]))
+        with open(ext, "w") as file:
+            file.write("subjectAltName=" + ",".join("DNS:" + i["value"] for i in order["identifiers"]) + "\nauthorityKeyIdentifier=keyid\n")
+        crt = subprocess.run(["openssl", "x509", "-req", "-inform", "DER", "-in", csr, "-CA", self.state.ca_crt, "-CAkey", self.state.ca_key, "-days", str(self.state.opts.days),
+                              "-extfile", ext, "-set_serial", str(random.getrandbits(63))], capture_output=True, check=True).stdout
+        os.remove(csr)
+        os.remove(ext)
+        self.state.certs[order_id] = crt + self.state.chain
+        order["status"], order["ready_at"] = "processing", time.time() + self.state.opts.finalize_delay
+        self.reply(200, {k: v for k, v in order.items() if k != "ready_at"}, headers={"Location": self.base() + "/order/%d" % order_id})
+
+    def post_cert(self, parts, protected, payload):
+        self.reply(200, self.state.certs[int(parts[0])], ctype="application/pem-certificate-chain")
+
+# start a server on a background thread; port 0 picks a free one (see server.server_address)
+def serve(opts, port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.state = State(opts)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def options(argv=None):
+    parser = argparse.ArgumentParser(description="Mock ACME server for offline benchmarks and tests.")
+    parser.add_argument("--port", type=int, default=14000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--bad-nonce", type=float, default=0.0, help="share of POSTs rejected with badNonce")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of POSTs rejected with 429 rateLimited (Retry-After: 1)")
+    parser.add_argument("--validation-delay", type=float, default=0.0, help="seconds from submitting a challenge until its authorization is valid")
+    parser.add_argument("--finalize-delay", type=float, default=0.0, help="seconds an order stays processing after finalize")
+    parser.add_argument("--days", type=int, default=90, help="validity of issued certificates")
+    parser.add_argument("--prevalid", action="store_true", help="create authorizations already valid")
+    parser.add_argument("--ari-offset", type=float, default=30 * 86400, help="renewal windows start this many seconds from now (negative: every certificate is due again at once)")
+    parser.add_argument("--no-reuse", action="store_true", help="never hand out valid authorizations again")
+    parser.add_argument("--fail", metavar="PREFIX", help="identifiers starting with this prefix fail validation")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__": # pragma: no cover
+    opts = options(sys.argv[1:])
+    server = serve(opts, opts.port)
+    print("directory: http://127.0.0.1:%d/directory" % server.server_address[1], flush=True)
+    threading.Event().wait()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# End-to-end throughput: issue certificates for N domains from bench/mock_acme.py with no-op hooks, once through
+# sign_crts and once through `acmectl.py unattended`, and report wall time, requests, connections, subprocesses
+# and peak RSS of each run. Each run is a fresh process (so its counts and RSS are its own) with a fresh account,
+# workdir and domain names, against one mock CA served from this process. The mock has no rate limits, so the
+# runs lift acme_hooked's local newOrder budget.
+# usage: python3 bench/throughput.py [--domains 1 10 100 1000] [--mode sign_crts unattended] [--sans 1]
+#                                    [--hook noop.sh|noop.py] [--hook-mode single] [--latency 0.05] [--bad-nonce 0.1] ...
+
+import argparse, json, os, subprocess, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH)
+import mock_acme
+
+def openssl(*args):
+    subprocess.run(["openssl"] + list(args), check=True, capture_output=True)
+
+def prepare(workdir, run, args):
+    # an account key, one EC key shared by all CSRs (the CA doesn't care), and CSRs of --sans names each, laid out
+    # as an acmectl workdir: certs/<name>.ecdsa.csr, linked from by-hook/dns/
+    for directory in ["certs", "state", os.path.join("by-hook", "dns"), os.path.join("hooks", "dns")]:
+        os.makedirs(os.path.join(workdir, directory))
+    openssl("genrsa", "-out", os.path.join(workdir, "account.key"), "2048")
+    openssl("ecparam", "-genkey", "-name", "prime256v1", "-out", os.path.join(workdir, "domain.key"))
+    names = ["d{0}.run{1}.example".format(i, run) for i in range(args.domains)]
+    groups = [names[i:i + args.sans] for i in range(0, len(names), args.sans)]
+
+    def csr(i, group):
+        path = os.path.join(workdir, "certs", "c{0}.ecdsa.csr".format(i))
+        openssl("req", "-new", "-key", os.path.join(workdir, "domain.key"), "-subj", "/", "-addext", "subjectAltName=" + ",".join("DNS:" + name for name in group), "-out", path)
+        os.symlink(path, os.path.join(workdir, "by-hook", "dns", os.path.basename(path)))
+        return path
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        csrs = list(executor.map(lambda job: csr(*job), enumerate(groups)))
+    os.symlink(os.path.join(BENCH, "hooks", args.hook), os.path.join(workdir, "hooks", "dns", args.hook))
+    return csrs
+
+def run_case(case):
+    # the child process: count every process it starts, run one mode, print the result as the last line
+    spawned = [0]
+    sys.addaudithook(lambda event, _: event in ("subprocess.Popen", "os.posix_spawn", "os.system") and spawned.__setitem__(0, spawned[0] + 1))
+    sys.path.insert(0, os.path.dirname(BENCH))
+    import acme_hooked
+    acme_hooked.RATE_LIMITS["newOrder"] = (10 ** 6, 1)
+    error = None
+    if case["mode"] == "sign_crts":
+        start_time = time.time()
+        try:
+            acme_hooked.sign_crts(os.path.join(case["workdir"], "account.key"), case["csrs"], directory_url=case["directory"], hook=[os.path.join(BENCH, "hooks", case["hook"])],
+                                  challenge_type="dns", concurrency=case["concurrency"], hook_mode=case["hook_mode"])
+        except (IOError, ValueError) as exception:
+            error = str(exception).splitlines()[0]
+    else:
+        os.chdir(case["workdir"]) # acmectl reads ./acmectl.conf when it is imported
+        import acmectl
+        start_time = time.time()
+        try:
+            acmectl.main(["-q", "-e", "mock", "unattended"])
+        except SystemExit as exception:
+            error = "exit status {0}".format(exception.code) if exception.code else None
+    print(json.dumps({"wall": time.time() - start_time, "subprocesses": spawned[0], "connections": acme_hooked._POOL.stats["handshakes"], "error": error}))
+
+def run(server, run_id, mode, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        csrs = prepare(workdir, run_id, args)
+        directory = "http://127.0.0.1:{0}/directory".format(server.server_address[1])
+        with open(os.path.join(workdir, "acmectl.conf"), "w") as file:
+            file.write("[general]\nWORKDIR = \nCURVE = secp256r1\nRENEW_THRESHOLD = 30\nCONCURRENCY = {0}\nWORKERS = {1}\nHOOK_MODE = {2}\nDNS_RESOLVERS = \n"
+                       "DNS_HOOK = {3}\nHTTP_HOOK = {3}\nLE_ACCOUNT_KEY = account.key\n[endpoints]\nMOCK = {4}\n".format(args.concurrency, args.workers, args.hook_mode, args.hook, directory))
+        case = {"mode": mode, "workdir": workdir, "csrs": csrs, "directory": directory, "hook": args.hook, "hook_mode": args.hook_mode, "concurrency": args.concurrency}
+        with server.state.lock:
+            before = dict(server.state.counts)
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)], stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.DEVNULL)
+        out = proc.stdout.read().decode()
+        proc.stdout.close()
+        _, status, usage = os.wait4(proc.pid, 0) # unlike Popen.wait, also returns the child's peak RSS
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        with server.state.lock:
+            delta = {key: value - before.get(key, 0) for key, value in server.state.counts.items()}
+    lines = out.strip().splitlines()
+    result = json.loads(lines[-1]) if lines and lines[-1].startswith("{") else {"wall": None, "subprocesses": None, "connections": None, "error": "exit status {0}".format(proc.returncode)}
+    return dict(result, mode=mode, domains=args.domains, certificates=len(csrs), peak_rss_mib=round(usage.ru_maxrss / 1024, 1),
+                requests=sum(value for key, value in delta.items() if key.startswith(("GET ", "POST "))),
+                bad_nonce=delta.get("badNonce", 0), rate_limited=delta.get("rateLimited", 0))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark certificate issuance end to end against a local mock ACME server.")
+    parser.add_argument("--case", help=argparse.SUPPRESS) # internal: run one case in this (child) process
+    parser.add_argument("--domains", type=int, nargs="+", default=[1, 10, 100, 1000], help="numbers of domains to issue for, one run each")
+    parser.add_argument("--mode", nargs="+", choices=["sign_crts", "unattended"], default=["sign_crts", "unattended"], help="drive acme_hooked.sign_crts directly, or acmectl.py unattended")
+    parser.add_argument("--sans", type=int, default=1, help="domains per certificate (up to 100)")
+    parser.add_argument("--hook", choices=["noop.sh", "noop.py"], default="noop.sh", help="no-op hook: a script (a process per call) or a plugin (in-process)")
+    parser.add_argument("--hook-mode", choices=["single", "batch", "serve"], default="single")
+    parser.add_argument("--concurrency", type=int, default=8, help="authorizations handled at the same time (CONCURRENCY)")
+    parser.add_argument("--workers", type=int, default=4, help="certificate names renewed at the same time in unattended mode (WORKERS)")
+    parser.add_argument("--latency", type=float, default=0.0, help="mock CA: seconds added to every request")
+    parser.add_argument("--bad-nonce", type=float, default=0.0, help="mock CA: share of POSTs rejected with badNonce")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="mock CA: share of POSTs rejected with 429")
+    parser.add_argument("--validation-delay", type=float, default=0.0, help="mock CA: seconds until a submitted challenge is valid")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per run instead of a table")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the runs' log output")
+    args = parser.parse_args(argv)
+    if args.case:
+        return run_case(json.loads(args.case))
+
+    opts = mock_acme.options([])
+    opts.latency, opts.bad_nonce, opts.rate_limit, opts.validation_delay = args.latency, args.bad_nonce, args.rate_limit, args.validation_delay
+    server = mock_acme.serve(opts)
+    columns = ["mode", "domains", "certificates", "wall", "requests", "connections", "subprocesses", "peak_rss_mib", "bad_nonce", "rate_limited", "error"]
+    if not args.json:
+        print("{0:<11}{1:>8}{2:>7}{3:>9}{4:>8}{5:>10}{6:>10}{7:>7}{8:>10}{9:>6}  {10}".format("mode", "domains", "certs", "wall s", "certs/s", "requests", "badNonce", "429", "processes", "MiB", "error"))
+    for run_id, domains in enumerate(args.domains):
+        for mode in args.mode:
+            result = run(server, "{0}{1}".format(run_id, mode[0]), mode, argparse.Namespace(**dict(vars(args), domains=domains)))
+            if args.json:
+                print(json.dumps({column: result[column] for column in columns}), flush=True)
+                continue
+            wall = result["wall"] or 0
+            print("{mode:<11}{domains:>8}{certificates:>7}{0:>9.2f}{1:>8.1f}{requests:>10}{bad_nonce:>10}{rate_limited:>7}{subprocesses:>10}{peak_rss_mib:>6.0f}  {2}".format(
+                wall, result["certificates"] / wall if wall else 0, result["error"] or "", **dict(result, subprocesses=result["subprocesses"] or 0)), flush=True)
+
+if __name__ == "__main__": # pragma: no cover
+    main(sys.argv[1:])
@@ -0,0 +1,127 @@
+#
+# acme-hooked - a script to issue TLS certificates via ACME
+# Copyright (C) 2015-2022 The acme-hooked authors
+# Copyright (C) 2023-2026 Nikita Sosnik
+# Licensed under the MIT license, see LICENSE.
+#
+# For use with CloudNS: https://www.cloudns.net/
+# Python port of cloudns.sh, loaded by acme_hooked as a plugin (DNS_HOOK = cloudns.py): it runs in-process and
+# every API call goes over the same keep-alive connection instead of a curl process each.
+# Same configuration and record id files as cloudns.sh, so the two can be swapped at any time.
+
+import http.client, json, os, shlex, subprocess, threading, time, urllib.parse
+
+# load config; required values: API_URL, SUB_AUTH_USER, AUTH_PASSWORD (and VALIDATION_ZONE); optional: DEPLOY_CMD
+CONFIG = {name: os.environ.get(name, "") for name in ["API_URL", "SUB_AUTH_USER", "AUTH_PASSWORD", "VALIDATION_ZONE", "DEPLOY_CMD"]}
+if os.path.isfile(os.path.join(os.getcwd(), "hooks", "dns", "cloudns.conf")):
+    with open(os.path.join(os.getcwd(), "hooks", "dns", "cloudns.conf")) as file:
+        for line in file:
+            name, equals, value = line.strip().removeprefix("export ").partition("=")
+            if equals and not name.startswith("#"):
+                CONFIG[name] = value.strip().strip("'\"")
+elif not (CONFIG["API_URL"] and CONFIG["SUB_AUTH_USER"] and CONFIG["AUTH_PASSWORD"]):
+    raise IOError("Missing required configuration values. Either create ./cloudns.conf or set API_URL, SUB_AUTH_USER, and AUTH_PASSWORD in the environment.")
+
+CHECK_URL = "https://1.1.1.1/dns-query" # cloudflare's DoH, like cloudns.sh
+CHECK_TIMEOUT = 3600 # seconds; aligns with the polling timeout of acme-hooked (_Poller)
+
+# one keep-alive connection per host (the API, the DoH resolver), reopened if the server closed it.
+# Calls can come from several threads, so each connection is used by one of them at a time.
+_CONNECTIONS, _LOCK = {}, threading.Lock()
+
+def _request(url, form=None):
+    parts = urllib.parse.urlsplit(url)
+    with _LOCK:
+        connection = _CONNECTIONS.setdefault(parts.netloc, [None, threading.Lock()])
+    with connection[1]:
+        for retry in [False, True]:
+            if connection[0] is None:
+                connection[0] = (http.client.HTTPConnection if parts.scheme == "http" else http.client.HTTPSConnection)(parts.netloc, timeout=30)
+            try:
+                if form is None:
+                    connection[0].request("GET", parts.path + "?" + parts.query, headers={"User-Agent": "acmectl", "Accept": "application/dns-json"})
+                else:
+                    connection[0].request("POST", parts.path, body=urllib.parse.urlencode(form), headers={"User-Agent": "acmectl", "Content-Type": "application/x-www-form-urlencoded"})
+                response = connection[0].getresponse()
+                data = response.read().decode("utf8")
+            except (http.client.HTTPException, OSError):
+                connection[0].close()
+                connection[0] = None
+                if retry:
+                    raise
+                continue
+            if response.will_close:
+                connection[0].close()
+                connection[0] = None
+            return data
+
+def _api(call, **form):
+    result = json.loads(_request(CONFIG["API_URL"] + "/" + call, dict(form, **{"sub-auth-user": CONFIG["SUB_AUTH_USER"], "auth-password": CONFIG["AUTH_PASSWORD"]})))
+    if result.get("status") != "Success":
+        raise IOError(result.get("statusDescription") or result)
+    return result
+
+def _id_file(content):
+    return os.path.join(os.getcwd(), "state", content + ".id")
+
+def setup(domain, token, content):
+    # add challenge for the given domain
+    # also save the record ID, will need it to delete the record later
+    try:
+        result = _api("add-record.json", **{"domain-name": CONFIG["VALIDATION_ZONE"], "record-type": "TXT", "host": "", "record": content, "ttl": 60})
+    except (IOError, ValueError) as error:
+        raise IOError("Failed to add challenge for {0}: {1}".format(domain, error))
+    with open(os.open(_id_file(content), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as file:
+        file.write(str(result["data"]["id"]))
+
+def check(domain, token, content):
+    # wait until the record is visible on the DoH resolver, checking every 5 seconds
+    deadline = time.time() + CHECK_TIMEOUT
+    while time.time() < deadline:
+        try:
+            if content in _request(CHECK_URL + "?" + urllib.parse.urlencode({"name": "_acme-challenge." + domain, "type": "TXT"})):
+                return
+        except (http.client.HTTPException, OSError):
+            pass
+        time.sleep(5)
+    raise IOError("Failed to check challenge for {0} after {1} seconds.".format(domain, CHECK_TIMEOUT))
+
+def remove(domain, token, content):
+    # remove the challenges for the given domain
+    if os.path.isfile(_id_file(content)):
+        with open(_id_file(content)) as file:
+            record_id = file.read().strip()
+        try:
+            _api("delete-record.json", **{"domain-name": CONFIG["VALIDATION_ZONE"], "record-id": record_id})
+        except (IOError, ValueError) as error:
+            raise IOError("Failed to remove challenge for {0}: {1}".format(domain, error))
+        os.remove(_id_file(content))
+
+def write(csrfile, certificate):
+    # save certificate to $PWD/certs/<certname>.crt atomically (synced temporary file renamed over the old one),
+    # keeping the previous one as .crt.bak. An unchanged certificate is left alone.
+    certname = os.path.basename(csrfile).removesuffix(".csr")
+    crtfile = os.path.join(os.getcwd(), "certs", certname + ".crt")
+    try:
+        with open(crtfile) as file:
+            if file.read() == certificate:
+                return "{0}: unchanged\n".format(certname)
+    except FileNotFoundError:
+        pass
+    with open(crtfile + ".tmp", "w") as file:
+        file.write(certificate)
+        file.flush()
+        os.fsync(file.fileno())
+    if os.path.isfile(crtfile): # the backup is a hard link, so the certificate is never missing
+        if os.path.exists(crtfile + ".bak"):
+            os.remove(crtfile + ".bak")
+        os.link(crtfile, crtfile + ".bak")
+    os.replace(crtfile + ".tmp", crtfile)
+    return "{0}\n".format(certname)
+
+def deploy(*csrfiles):
+    # called once after all certificates of a run are written, e.g. DEPLOY_CMD="sudo systemctl reload nginx"
+    if CONFIG["DEPLOY_CMD"]:
+        result = subprocess.run(shlex.split(CONFIG["DEPLOY_CMD"]), capture_output=True, text=True)
+        if result.returncode != 0:
+            raise IOError("Failed to deploy: {0}\n{1}".format(CONFIG["DEPLOY_CMD"], result.stderr))
@@ -94,17 +94,61 @@ write()
   # read certificate from stdin and process it
   # any output of this function is echoed by acme_hooked
   # the CSR path is passed as the first argument
-  echo $1 
-  certname="$(basename $1 .csr)"
-  echo $certname
-  # save certificate to $PWD/certs/<certname>.crt
-  if [ -f "$PWD/certs/${certname}.crt" ]; then
-    mv "$PWD/certs/${certname}.crt" "$PWD/certs/${certname}.crt.bak" > /dev/null 2>&1 || true # backup existing cert if it exists
+  certname="$(basename "$1" .csr)"
+  crtfile="$PWD/certs/${certname}.crt"
+  # save certificate to $PWD/certs/<certname>.crt atomically: write and sync a temporary file, keep the existing
+  # cert as .bak (a hard link, so it's never missing) and rename the new one over it. An unchanged cert is left alone.
+  cat > "${crtfile}.tmp" && sync "${crtfile}.tmp" || die "Failed to write ${crtfile}"
+  if cmp -s "${crtfile}.tmp" "${crtfile}"; then
+    rm -f "${crtfile}.tmp"
+    echo "${certname}: unchanged"
+    return
   fi
-  # write new cert
-  cat > "$PWD/certs/${certname}.crt"
+  if [ -f "${crtfile}" ]; then
+    ln -f "${crtfile}" "${crtfile}.bak" # backup existing cert if it exists
+  fi
+  mv -f "${crtfile}.tmp" "${crtfile}" || die "Failed to write ${crtfile}"
+  echo "${certname}"
 }
 
+deploy()
+{
+  # called once after all certificates of a run are written, with their CSR paths as arguments
+  # e.g. set DEPLOY_CMD="sudo systemctl reload nginx" in cloudns.conf
+  if [ -n "${DEPLOY_CMD}" ]; then
+    ${DEPLOY_CMD} || die "Failed to deploy: ${DEPLOY_CMD}"
+  fi
+}
+
+
+# batch/serve protocol (acme_hooked --hook-mode batch|serve): one JSON request per line on stdin,
+# {"id":0,"cmd":"setup","domain":"...","token":"...","content":"..."}, one JSON answer per line on stdout,
+# {"id":0,"status":"ok","detail":"..."}. `batch` exits at EOF, `serve` is the same loop kept open for a whole run.
+# Each request runs in a subshell, so die() fails that request instead of the whole process.
+field()
+{
+  REPLY=""
+  [[ "$2" =~ \"$1\":\ *\"?([^\",}]*) ]] && REPLY="${BASH_REMATCH[1]}"
+}
+
+serve()
+{
+  while IFS= read -r line; do
+    field id "$line"; id="$REPLY"
+    field cmd "$line"; cmd="$REPLY"
+    field domain "$line"; domain="$REPLY"
+    field token "$line"; token="$REPLY"
+    field content "$line"; content="$REPLY"
+    case "$cmd" in
+      setup|check|remove) output="$( "$cmd" "$domain" "$token" "$content" 2>&1 )" ;;
+      activate|finish) output="$( "$cmd" 2>&1 )" ;;
+      *) output="Unknown command: $cmd"; false ;;
+    esac
+    if [[ $? -eq 0 ]]; then status="ok"; else status="error"; fi
+    output="${output//\\/\\\\}"; output="${output//\"/\\\"}"; output="${output//$'\n'/\\n}"
+    printf '{"id":%s,"status":"%s","detail":"%s"}\n' "${id:-null}" "$status" "$output"
+  done
+}
 
 [[ $# -ge 1 ]] || die 'Missing arguments.'
 if [[ "$1" == 'setup' ]]; then
@@ -125,6 +169,11 @@ elif [[ "$1" == 'finish' ]]; then
 elif [[ "$1" == 'write' ]]; then
   [[ $# == 2 ]] || die 'Wrong number of arguments.'
   write "$2"
+elif [[ "$1" == 'deploy' ]]; then
+  deploy "${@:2}"
+elif [[ "$1" == 'batch' || "$1" == 'serve' ]]; then
+  [[ $# == 1 ]] || die 'Wrong number of arguments.'
+  serve
 else
   die "Unknown command: $1"
 fi
\ No newline at end of file
@@ -0,0 +1,87 @@
+# acme-hooked - a script to issue TLS certificates via ACME
+# Copyright (C) 2015-2021 The acme-hooked authors.
+# Licensed under the MIT license, see LICENSE.
+
+# this plugin moves the challenge files into the .well-known directory
+# to satisfy the HTTP-01 type check.
+# Python port of nginx.sh, loaded by acme_hooked as a plugin (HTTP_HOOK = nginx.py): it runs in-process, and
+# the checks of a domain reuse one keep-alive connection instead of a curl process each.
+
+import http.client, os, subprocess, threading, time
+
+# change this to appropriate values for your setting
+ACME_DIR = "/var/www/challenges/"
+CHECK_TIMEOUT = 60 # seconds
+DEPLOY_CMD = ["sudo", "systemctl", "reload", "nginx"] # run once per run after writing certificates, empty to skip
+
+# one keep-alive connection per domain, reopened if the server closed it
+_CONNECTIONS, _LOCK = {}, threading.Lock()
+
+def _get(domain, path):
+    with _LOCK:
+        connection = _CONNECTIONS.setdefault(domain, [None, threading.Lock()])
+    with connection[1]:
+        for retry in [False, True]:
+            if connection[0] is None:
+                connection[0] = http.client.HTTPConnection(domain, timeout=10)
+            try:
+                connection[0].request("GET", path, headers={"User-Agent": "acmectl"})
+                response = connection[0].getresponse()
+                data = response.read().decode("utf8", "replace")
+            except (http.client.HTTPException, OSError):
+                connection[0].close()
+                connection[0] = None
+                if retry:
+                    raise
+                continue
+            if response.will_close:
+                connection[0].close()
+                connection[0] = None
+            return data
+
+def setup(domain, token, content):
+    # add challenge for the given domain
+    with open(os.path.join(ACME_DIR, token), "w") as file:
+        file.write(content + "\n")
+
+def check(domain, token, content):
+    # check that challenge is ready for the ACSD server
+    deadline = time.time() + CHECK_TIMEOUT
+    while time.time() < deadline:
+        try:
+            if _get(domain, "/.well-known/acme-challenge/" + token).strip() == content:
+                return
+        except (http.client.HTTPException, OSError):
+            pass
+        time.sleep(3)
+    raise IOError("Check did not finish successfully within the timeout!")
+
+def remove(domain, token, content):
+    # remove the challenges for the given domain
+    try:
+        os.remove(os.path.join(ACME_DIR, token))
+    except FileNotFoundError:
+        pass
+
+def write(csrfile, certificate):
+    # write the certificate next to the csr: to a temporary file, synced and renamed over the old one, so nginx
+    # never reads half a certificate. An unchanged certificate is left alone.
+    crtfile = os.path.realpath(csrfile.removesuffix(".csr") + ".crt") # replace what a linked certificate points to, not the link
+    try:
+        with open(crtfile) as file:
+            if file.read() == certificate:
+                return
+    except FileNotFoundError:
+        pass
+    with open(crtfile + ".tmp", "w") as file:
+        file.write(certificate)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(crtfile + ".tmp", crtfile)
+
+def deploy(*csrfiles):
+    # called once after all certificates of a run are written
+    if DEPLOY_CMD:
+        result = subprocess.run(DEPLOY_CMD, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise IOError("Failed to deploy: {0}\n{1}".format(" ".join(DEPLOY_CMD), result.stderr))
@@ -12,6 +12,7 @@
 # change this to appropriate values for your setting
 declare -r ACME_DIR="/var/www/challenges/"
 declare -r CHECKTIMEOUT=60 # seconds
+declare -r DEPLOYCMD="sudo systemctl reload nginx" # run once per run after writing certificates, empty to skip
 
 die()
 {
@@ -76,10 +77,51 @@ write()
 
 	# read certificate from stdin and process it
 	# any output of this function is echoed by acme_hooked
-	crtfile="${csrfile%.csr}.crt"
-	cat > "${crtfile}"
+	# written to a temporary file, synced and renamed over the old one, so nginx never reads half a certificate
+	crtfile="$(readlink -f "${csrfile%.csr}.crt")" # replace what a linked certificate points to, not the link
+	cat > "${crtfile}.tmp" && sync "${crtfile}.tmp" || die "Failed to write ${crtfile}"
+	if cmp -s "${crtfile}.tmp" "${crtfile}"; then
+		rm -f "${crtfile}.tmp"
+		return
+	fi
+	mv -f "${crtfile}.tmp" "${crtfile}" || die "Failed to write ${crtfile}"
 }
 
+deploy()
+{
+	# called once after all certificates of a run are written, with their CSR paths as arguments
+	[[ -z "${DEPLOYCMD}" ]] || ${DEPLOYCMD} || die "Failed to deploy: ${DEPLOYCMD}"
+}
+
+
+# batch/serve protocol (acme_hooked --hook-mode batch|serve): one JSON request per line on stdin,
+# {"id":0,"cmd":"setup","domain":"...","token":"...","content":"..."}, one JSON answer per line on stdout,
+# {"id":0,"status":"ok","detail":"..."}. `batch` exits at EOF, `serve` is the same loop kept open for a whole run.
+# Each request runs in a subshell, so die() fails that request instead of the whole process.
+field()
+{
+	REPLY=""
+	[[ "$2" =~ \"$1\":\ *\"?([^\",}]*) ]] && REPLY="${BASH_REMATCH[1]}"
+}
+
+serve()
+{
+	while IFS= read -r line; do
+		field id "$line"; id="$REPLY"
+		field cmd "$line"; cmd="$REPLY"
+		field domain "$line"; domain="$REPLY"
+		field token "$line"; token="$REPLY"
+		field content "$line"; content="$REPLY"
+		case "$cmd" in
+			setup|check|remove) output="$( "$cmd" "$domain" "$token" "$content" 2>&1 )" ;;
+			activate|finish) output="$( "$cmd" 2>&1 )" ;;
+			*) output="Unknown command: $cmd"; false ;;
+		esac
+		if [[ $? -eq 0 ]]; then status="ok"; else status="error"; fi
+		output="${output//\\/\\\\}"; output="${output//\"/\\\"}"; output="${output//$'\n'/\\n}"
+		printf '{"id":%s,"status":"%s","detail":"%s"}\n' "${id:-null}" "$status" "$output"
+	done
+}
 
 [[ $# -ge 1 ]] || die 'Missing arguments.'
 if [[ "$1" == 'setup' ]]; then
@@ -100,6 +142,11 @@ elif [[ "$1" == 'finish' ]]; then
 elif [[ "$1" == 'write' ]]; then
 	[[ $# == 2 ]] || die 'Wrong number of arguments.'
 	write "$2"
+elif [[ "$1" == 'deploy' ]]; then
+	deploy "${@:2}"
+elif [[ "$1" == 'batch' || "$1" == 'serve' ]]; then
+	[[ $# == 1 ]] || die 'Wrong number of arguments.'
+	serve
 else
 	die "Unknown command: $1"
 fi